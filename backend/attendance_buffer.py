@@ -0,0 +1,275 @@
+"""
+Write-behind buffer for attendance marks.
+
+Accepted marks go into an in-memory present set per (section, date), which
+answers "already marked" checks without a database round trip, and are
+written to Mongo by a background flusher with unordered bulk upserts every
+flush_interval seconds or once max_pending marks are waiting.
+
+Every mark is first appended to a local journal (one JSON record per line).
+Appends run in a thread with group commit: marks that arrive while a write
+is in progress share the next write and fsync. Before a flush the journal
+segment is rotated, and a segment is deleted only after its marks were
+written, so marks of a crashed process are replayed at startup. Upserts are
+keyed on the unique (section_id, date, student_id) index, so replaying a
+mark that did reach Mongo is harmless.
+
+An optional on_write coroutine is called with every batch of marks once it
+is stored, e.g. to maintain counters derived from attendance.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger("backend.attendance_buffer")
+
+
+def _write_lines(journal, lines: List[str]) -> None:
+    journal.write("".join(lines))
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+async def _write(attendance, marks: List[Dict[str, Any]]) -> None:
+    try:
+        await attendance.bulk_write([_upsert(m) for m in marks], ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys only mean another writer stored the same mark first
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+def _upsert(mark: Dict[str, Any]) -> UpdateOne:
+    return UpdateOne(
+        {"section_id": mark["section_id"], "date": mark["date"], "student_id": mark["student_id"]},
+        {"$setOnInsert": {
+            "id": mark["id"],
+            "status": "Present",
+            "teacher_id": mark["teacher_id"],
+            "timestamp": datetime.fromisoformat(mark["timestamp"]),
+        }},
+        upsert=True,
+    )
+
+
+class AttendanceBuffer:
+    def __init__(self, attendance, journal_path, flush_interval: float = 0.5, max_pending: int = 200,
+                 on_write: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None):
+        self.attendance = attendance  # motor collection
+        self.on_write = on_write
+        self.journal_path = Path(journal_path)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._present: Dict[Tuple[str, str], Set[str]] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []  # marks of the flush in progress
+        self._journal = None
+        self._segment = 0
+        self._sealed: List[Path] = []  # rotated segments whose marks are not written yet
+        self._batch: List[Dict[str, Any]] = []  # marks waiting for the next journal write
+        self._batch_done: Optional[asyncio.Future] = None
+        self._syncing = False
+        self._journal_lock = asyncio.Lock()  # journal writes vs segment rotation
+        self._loads: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.flush_failures = 0
+
+    async def _written(self, marks: List[Dict[str, Any]]) -> None:
+        if self.on_write is None:
+            return
+        try:
+            await self.on_write(marks)
+        except Exception as e:
+            # The marks themselves are stored; only derived data is behind
+            logger.error(f"on_write for {len(marks)} attendance marks failed: {e}")
+
+    # ---------- journal ----------
+    def _segments(self) -> List[Path]:
+        return sorted(self.journal_path.parent.glob(self.journal_path.name + ".*"),
+                      key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else -1)
+
+    def _open_segment(self) -> None:
+        segments = self._segments()
+        last = int(segments[-1].suffix[1:]) if segments and segments[-1].suffix[1:].isdigit() else 0
+        self._segment = last + 1
+        self._journal = open(f"{self.journal_path}.{self._segment}", "a", encoding="utf-8")
+
+    async def _append(self, mark: Dict[str, Any]) -> None:
+        """Journal a mark (fsynced) and queue it for the next flush."""
+        self._batch.append(mark)
+        if self._batch_done is None:
+            self._batch_done = asyncio.get_running_loop().create_future()
+        done = self._batch_done
+        if not self._syncing:
+            self._syncing = True
+            asyncio.ensure_future(self._sync())
+        await done
+
+    async def _sync(self) -> None:
+        try:
+            while self._batch:
+                marks, done = self._batch, self._batch_done
+                self._batch, self._batch_done = [], None
+                async with self._journal_lock:
+                    try:
+                        await asyncio.to_thread(_write_lines, self._journal, [json.dumps(m) + "\n" for m in marks])
+                    except Exception as e:
+                        done.set_exception(e)
+                        continue
+                    # Queued under the lock, so a mark is pending exactly when
+                    # it is in the current segment or a sealed one
+                    self._pending.extend(marks)
+                done.set_result(None)
+                if len(self._pending) >= self.max_pending:
+                    self._flush_now.set()
+        finally:
+            self._syncing = False
+
+    async def replay(self) -> int:
+        """Write marks left in journal segments by a previous process; returns how many."""
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        replayed = 0
+        for segment in self._segments():
+            marks = []
+            with open(segment, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        marks.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        logger.warning(f"Skipping unreadable journal line in {segment}")
+            if marks:
+                await _write(self.attendance, marks)
+                await self._written(marks)
+                replayed += len(marks)
+            segment.unlink()
+        if replayed:
+            logger.info(f"Replayed {replayed} journaled attendance marks")
+        return replayed
+
+    # ---------- marks ----------
+    async def _present_set(self, section_id: str, date: str) -> Set[str]:
+        key = (section_id, date)
+        present = self._present.get(key)
+        if present is not None:
+            return present
+        # First mark of the day in this process: seed from what is already stored
+        load = self._loads.get(key)
+        if load is None:
+            load = self._loads[key] = asyncio.ensure_future(self.attendance.distinct(
+                "student_id", {"section_id": section_id, "date": date}))
+        try:
+            stored = await load
+        finally:
+            self._loads.pop(key, None)
+        # Drop sets of earlier days
+        for old in [k for k in self._present if k[1] != date]:
+            del self._present[old]
+        return self._present.setdefault(key, set(stored))
+
+    async def mark(self, section_id: str, student_id: str, teacher_id: str, date: str, timestamp: datetime, mark_id: str) -> bool:
+        """Accept a mark; False when the student is already present for the date."""
+        present = await self._present_set(section_id, date)
+        if student_id in present:
+            return False
+        present.add(student_id)
+        mark = {"id": mark_id, "section_id": section_id, "date": date, "student_id": student_id,
+                "teacher_id": teacher_id, "timestamp": timestamp.isoformat()}
+        try:
+            await self._append(mark)
+        except Exception:
+            present.discard(student_id)
+            raise
+        return True
+
+    def present(self, section_id: str, date: str) -> Set[str]:
+        """Students accepted for the section and date by this process (possibly not flushed yet)."""
+        return set(self._present.get((section_id, date), ()))
+
+    def unflushed(self, date: str) -> Dict[str, List[str]]:
+        """
+        Student ids per section for the date whose marks may not be stored
+        yet: queued ones and those of a flush in progress (which may already
+        be stored, so callers union them with what they read).
+        """
+        ids: Dict[str, List[str]] = {}
+        for mark in self._in_flight + self._pending:
+            if mark["date"] == date:
+                ids.setdefault(mark["section_id"], []).append(mark["student_id"])
+        return ids
+
+    # ---------- flushing ----------
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            async with self._journal_lock:
+                if not self._pending:
+                    return
+                marks, self._pending = self._pending, []
+                # Later marks go to a fresh segment; sealed ones are deleted once
+                # written. While an earlier flush is unwritten (Mongo down) the
+                # current segment is kept, so retries do not pile up files; its
+                # marks are then written again after the next rotation, which
+                # the upserts make harmless.
+                if not self._sealed:
+                    self._sealed.append(Path(self._journal.name))
+                    self._journal.close()
+                    self._open_segment()
+            self._in_flight = marks
+            try:
+                await _write(self.attendance, marks)
+            except Exception as e:
+                # Keep the segments (replayed at startup) and retry the marks on the next flush
+                self.flush_failures += 1
+                logger.error(f"Attendance flush of {len(marks)} marks failed: {e}")
+                self._pending = marks + self._pending
+                return
+            finally:
+                self._in_flight = []
+            for segment in self._sealed:
+                segment.unlink(missing_ok=True)
+            self._sealed = []
+            self.flushed += len(marks)
+            await self._written(marks)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        await self.replay()
+        self._open_segment()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            # The current segment only holds marks that arrived after the last flush
+            current = Path(self._journal.name)
+            if current.exists() and current.stat().st_size == 0:
+                current.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "flushed": self.flushed, "flush_failures": self.flush_failures,
+                "sections": len(self._present)}
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Local benchmarks for the face pipeline. Run from the backend directory, e.g.
+
+    python bench.py detect --images ./samples --workers 1 2 4 8
+    python bench.py detectors --images ./samples_by_student
+    python bench.py decode --images ./phone_photos --target-side 1280
+    python bench.py roster --mongo-url mongodb://localhost:27017 --students 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def image_paths(folder: str) -> List[Path]:
+    paths = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        sys.exit(f"No images found in {folder}")
+    return paths
+
+
+def load_images(folder: str) -> List[bytes]:
+    return [p.read_bytes() for p in image_paths(folder)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def bench_detect(args) -> None:
+    """End-to-end detection throughput through DetectionPool for each worker count."""
+    from face_workers import DetectionPool
+
+    images = load_images(args.images)
+
+    async def run(workers: int):
+        pool = DetectionPool(workers, queue_size=args.requests, detector_kind=args.detector)
+        try:
+            # Spawn workers and load models before timing
+            await asyncio.gather(*(pool.detect(images[0]) for _ in range(workers)))
+            sem = asyncio.Semaphore(args.concurrency)
+            failures = 0
+
+            async def one(i: int):
+                nonlocal failures
+                async with sem:
+                    face, err = await pool.detect(images[i % len(images)])
+                    if face is None:
+                        failures += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.shutdown()
+        return elapsed, failures
+
+    print(f"{len(images)} images, {args.requests} requests, concurrency {args.concurrency}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>9} {'img/s':>8} {'no_face':>8}")
+    for workers in args.workers:
+        elapsed, failures = asyncio.run(run(workers))
+        print(f"{workers:>8} {elapsed:>9.2f} {args.requests / elapsed:>8.1f} {failures:>8}")
+
+
+def bench_detectors(args) -> None:
+    """
+    Compare crop latency and match rate of each detector on the same images.
+
+    Images are grouped by their parent folder (one folder per person). The
+    first image of each person, cropped with the mesh detector, is the
+    reference; every other image is cropped with the detector under test,
+    embedded and counted as a match when its best reference is the same
+    person at or above the attendance threshold.
+    """
+    import numpy as np
+    from face_workers import DETECTOR_KINDS, create_detector, detect_and_crop
+    from embedding import InterpreterPool, embed_face
+
+    paths = image_paths(args.images)
+    labels = [p.parent.name for p in paths]
+    images = [p.read_bytes() for p in paths]
+
+    pool = None
+    model_path = Path(__file__).parent / "models" / "mobilefacenet.tflite"
+    try:
+        pool = InterpreterPool(model_path, 1, args.threads)
+    except Exception as e:
+        print(f"MobileFaceNet unavailable ({e}); reporting detection only")
+
+    references = {}
+    mesh = None
+    if pool is not None:
+        try:
+            mesh = create_detector("mesh")
+        except Exception as e:
+            print(f"Mesh reference detector unavailable ({e}); reporting detection only")
+    if mesh is not None:
+        for label, data in zip(labels, images):
+            if label in references:
+                continue
+            face, _ = detect_and_crop(mesh, data)
+            if face is not None:
+                emb, _ = embed_face(pool, face)
+                if emb is not None:
+                    references[label] = np.asarray(emb, dtype=np.float32)
+    ref_labels = list(references)
+    ref_matrix = np.stack([references[k] for k in ref_labels]) if ref_labels else None
+
+    print(f"{len(images)} images, {len(set(labels))} people")
+    print(f"{'detector':>10} {'found':>7} {'p50 ms':>8} {'p95 ms':>8} {'match':>7}")
+    for kind in args.detectors or DETECTOR_KINDS:
+        try:
+            detector = create_detector(kind)
+        except Exception as e:
+            print(f"{kind:>10}  unavailable: {e}")
+            continue
+        latencies, found, probes, matched = [], 0, 0, 0
+        seen = set()
+        for label, data in zip(labels, images):
+            start = time.perf_counter()
+            face, _ = detect_and_crop(detector, data)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if face is None:
+                continue
+            found += 1
+            # Skip each person's reference image when scoring matches
+            if ref_matrix is None or label not in seen:
+                seen.add(label)
+                continue
+            emb, _ = embed_face(pool, face)
+            if emb is None:
+                continue
+            probes += 1
+            sims = ref_matrix @ np.asarray(emb, dtype=np.float32)
+            best = int(np.argmax(sims))
+            if ref_labels[best] == label and sims[best] >= args.threshold:
+                matched += 1
+        match = f"{matched / probes:.1%}" if probes else "n/a"
+        print(f"{kind:>10} {found / len(images):>7.1%} {percentile(latencies, 0.5):>8.1f} "
+              f"{percentile(latencies, 0.95):>8.1f} {match:>7}")
+
+
+def _decode_images(mode: str, folder: str, target_side: int):
+    """
+    Decode every image with one mode; runs in a fresh process per mode so
+    its peak RSS covers only that mode. Returns (times in ms, peak MiB above
+    the RSS after loading the images).
+    """
+    import resource
+    import numpy as np
+    import cv2
+    from face_workers import BoundedImage
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    images = load_images(folder)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for data in images:
+        start = time.perf_counter()
+        if mode == "full":
+            cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            BoundedImage(data, target_side)
+        times.append((time.perf_counter() - start) * 1000)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return times, (peak - baseline) * unit / 2 ** 20
+
+
+def bench_decode(args) -> None:
+    """
+    Decode time and peak memory: full-resolution imdecode vs BoundedImage.
+    Memory is the process RSS, which includes the native libjpeg/OpenCV
+    buffers that tracemalloc does not see.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    count = len(image_paths(args.images))
+    rows = []
+    for mode in ("full", "bounded"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            rows.append((mode, *executor.submit(_decode_images, mode, args.images, args.target_side).result()))
+
+    print(f"{count} images, target side {args.target_side}px")
+    print(f"{'decode':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS MiB':>13}")
+    for name, times, peak in rows:
+        print(f"{name:>8} {percentile(times, 0.5):>8.1f} {percentile(times, 0.95):>8.1f} {peak:>13.1f}")
+    print("(peak RSS is the growth over the process after loading the images)")
+
+
+def bench_roster(args) -> None:
+    """
+    Bytes read and latency of student roster reads on a synthetic school:
+    whole documents vs projected fields vs the in-process roster cache.
+
+    The school is written to a scratch database (dropped afterwards) with
+    args.embeddings stored embeddings per student, like enrolled students.
+    The database must not be DB_NAME or hold anything but students.
+    """
+    import uuid
+    import numpy as np
+    from bson.raw_bson import RawBSONDocument
+    from pymongo import MongoClient
+    from embedding_store import encode_embeddings
+    from roster import ROSTER_PROJECTION, RosterCache
+
+    if args.db == os.environ.get("DB_NAME"):
+        sys.exit(f"Refusing to use {args.db}: it is the application database (DB_NAME)")
+    client = MongoClient(args.mongo_url)
+    db = client[args.db]
+    # The database is dropped afterwards, so it must hold nothing but a previous run
+    other = set(db.list_collection_names()) - {"students"}
+    if other:
+        sys.exit(f"Refusing to use {args.db}: it has other collections ({', '.join(sorted(other))})")
+    db.students.drop()
+    rng = np.random.default_rng(0)
+    section_ids = [str(uuid.uuid4()) for _ in range(max(1, args.students // args.section_size))]
+    docs = []
+    for i in range(args.students):
+        sid = str(uuid.uuid4())
+        docs.append({
+            "id": sid, "name": f"Student {i}", "student_code": sid[:8], "roll_no": str(i),
+            "section_id": section_ids[i % len(section_ids)], "parent_mobile": None,
+            "has_twin": False, "twin_group_id": None, "created_at": time.time(),
+            "face_embeddings": encode_embeddings(rng.standard_normal((args.embeddings, 128)).astype(np.float32)),
+        })
+    # Every field but the embeddings, like STUDENT_PROJECTION in server.py
+    student_projection = {"_id": 0, **{k: 1 for k in docs[0] if k != "face_embeddings"}}
+    db.students.insert_many(docs)
+    db.students.create_index("section_id")
+    raw = db.get_collection("students", codec_options=db.codec_options.with_options(document_class=RawBSONDocument))
+
+    def read(query, projection):
+        docs = list(raw.find(query, projection))
+        return sum(len(d.raw) for d in docs)
+
+    def measure(query_for, projection, repeat=args.repeat):
+        times, nbytes = [], 0
+        for i in range(repeat):
+            start = time.perf_counter()
+            nbytes = read(query_for(i), projection)
+            times.append((time.perf_counter() - start) * 1000)
+        return nbytes, times
+
+    section = lambda i: {"section_id": section_ids[i % len(section_ids)]}  # noqa: E731
+    school = lambda i: {"section_id": {"$in": section_ids}}  # noqa: E731
+    rows = [
+        ("section full", *measure(section, None)),
+        ("section roster", *measure(section, ROSTER_PROJECTION)),
+        ("school full", *measure(school, None, max(5, args.repeat // 20))),
+        ("school projected", *measure(school, student_projection, max(5, args.repeat // 20))),
+    ]
+
+    # Cached roster: misses read once per section, then every read is a hit
+    cache, times = RosterCache(len(section_ids)), []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        key = section_ids[i % len(section_ids)]
+        if cache.get(key) is None:
+            cache.put(key, list(db.students.find(section(i), ROSTER_PROJECTION)), cache.generation(key))
+        times.append((time.perf_counter() - start) * 1000)
+    rows.append(("section cached", 0, times))
+
+    print(f"{args.students} students in {len(section_ids)} sections, {args.embeddings} embeddings each, "
+          f"{args.repeat} section / {max(5, args.repeat // 20)} school reads")
+    print(f"{'read':>18} {'KiB/read':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, nbytes, times in rows:
+        print(f"{name:>18} {nbytes / 1024:>9.1f} {percentile(times, 0.5):>8.2f} {percentile(times, 0.95):>8.2f}")
+    print("(section cached: KiB/read is 0 once the section is cached; misses are included in the timings)")
+    client.drop_database(args.db)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("detect", help="detection throughput per worker count")
+    p.add_argument("--images", required=True, help="folder of face images")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--detector", default="mesh")
+    p.set_defaults(func=bench_detect)
+
+    p = sub.add_parser("detectors", help="crop latency and match rate per detector")
+    p.add_argument("--images", required=True, help="folder with one sub-folder of face images per person")
+    p.add_argument("--detectors", nargs="+", help="detectors to compare (default: all)")
+    p.add_argument("--threshold", type=float, default=0.90)
+    p.add_argument("--threads", type=int, default=2, help="MobileFaceNet interpreter threads")
+    p.set_defaults(func=bench_detectors)
+
+    p = sub.add_parser("decode", help="decode time and peak memory, full vs bounded")
+    p.add_argument("--images", required=True, help="folder of (large) JPEG uploads")
+    p.add_argument("--target-side", type=int, default=1280)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("roster", help="bytes and latency of roster reads, full vs projected vs cached")
+    p.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    p.add_argument("--db", default="bench_roster", help="scratch database, dropped afterwards")
+    p.add_argument("--students", type=int, default=5000)
+    p.add_argument("--section-size", type=int, default=50)
+    p.add_argument("--embeddings", type=int, default=5, help="stored embeddings per student")
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_roster)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Reading bulk enrollment uploads: a ZIP archive with one folder of face images
+per student plus a CSV roster.
+
+The roster has a header row with the columns
+
+    folder, name, roll_no, parent_mobile, has_twin, twin_group_id
+
+of which only name is required; folder defaults to roll_no, then name. The
+CSV can be uploaded separately or placed at the root of the archive.
+
+The archive is opened from a file on disk and members are read one student at
+a time, so it is never held in memory as a whole. Members larger than the
+size caps are never decompressed: oversized images are skipped and an
+oversized roster is rejected.
+"""
+import csv
+import io
+import zipfile
+from pathlib import PurePosixPath
+from typing import Dict, Iterator, List, Optional
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+TRUE_VALUES = {"1", "true", "yes", "y"}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_ROSTER_BYTES = 5 * 1024 * 1024
+
+
+class BulkEnrollmentError(Exception):
+    """The archive or roster cannot be used at all."""
+
+
+def _clean(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    return value or None
+
+
+def read_roster(data: bytes) -> List[Dict[str, object]]:
+    """Parse the roster CSV into student rows (row numbers count the header as 1)."""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BulkEnrollmentError("Roster CSV must be UTF-8")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or "name" not in [f.strip().lower() for f in reader.fieldnames]:
+        raise BulkEnrollmentError("Roster CSV needs a header row with at least a 'name' column")
+    rows = []
+    for line, raw in enumerate(reader, start=2):
+        row = {(k or "").strip().lower(): v for k, v in raw.items()}
+        name, roll_no = _clean(row.get("name")), _clean(row.get("roll_no"))
+        rows.append({
+            "row": line,
+            "folder": _clean(row.get("folder")) or roll_no or name,
+            "name": name,
+            "roll_no": roll_no,
+            "parent_mobile": _clean(row.get("parent_mobile")),
+            "has_twin": (row.get("has_twin") or "").strip().lower() in TRUE_VALUES,
+            "twin_group_id": _clean(row.get("twin_group_id")),
+        })
+    return rows
+
+
+class EnrollmentArchive:
+    """
+    Index of a ZIP archive's image members by their folder name. Images whose
+    uncompressed size is above max_image_bytes are left out of the index and
+    counted per folder in oversized.
+    """
+
+    def __init__(self, path: str, max_image_bytes: int = MAX_IMAGE_BYTES,
+                 max_roster_bytes: int = MAX_ROSTER_BYTES):
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise BulkEnrollmentError("Upload is not a valid ZIP archive")
+        self.max_roster_bytes = max_roster_bytes
+        self.folders: Dict[str, List[str]] = {}
+        self.oversized: Dict[str, int] = {}
+        self.roster_member: Optional[zipfile.ZipInfo] = None
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            path = PurePosixPath(info.filename)
+            if any(part.startswith((".", "__MACOSX")) for part in path.parts):
+                continue
+            if path.suffix.lower() == ".csv" and len(path.parts) == 1:
+                self.roster_member = info
+            elif path.suffix.lower() in IMAGE_SUFFIXES and len(path.parts) >= 2:
+                if info.file_size > max_image_bytes:
+                    self.oversized[path.parent.name] = self.oversized.get(path.parent.name, 0) + 1
+                else:
+                    self.folders.setdefault(path.parent.name, []).append(info.filename)
+
+    def roster(self) -> bytes:
+        if self.roster_member is None:
+            raise BulkEnrollmentError("No roster CSV uploaded or found at the archive root")
+        if self.roster_member.file_size > self.max_roster_bytes:
+            raise BulkEnrollmentError(f"Roster CSV is larger than {self.max_roster_bytes // (1024 * 1024)} MB")
+        return self._zip.read(self.roster_member)
+
+    def images(self, folder: str, limit: int) -> Iterator[bytes]:
+        for member in sorted(self.folders.get(folder, []))[:limit]:
+            yield self._zip.read(member)
+
+    def close(self) -> None:
+        self._zip.close()
@@ -0,0 +1,95 @@
+"""
+Cache invalidation across API instances.
+
+Galleries, rosters and school indexes are cached per process, while students
+can be changed through any instance (or by a job worker). Every change bumps
+a counter document in Mongo
+
+    {_id: "section:<id>" | "school:<id>", section_id, school_id, v, updated_at}
+
+and each instance polls for counters it has not seen yet, so a change made
+elsewhere reaches its caches within poll_seconds. A poll re-reads everything
+changed in the last lookback_seconds, which covers clock skew between
+instances and writes that were in flight during the previous poll.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger("backend.cache_sync")
+
+
+class CacheVersions:
+    def __init__(self, collection, on_change: Callable[[Dict[str, Any]], None],
+                 poll_seconds: float = 2.0, lookback_seconds: float = 30.0):
+        self.collection = collection  # motor collection
+        self.on_change = on_change  # called with each counter document changed elsewhere
+        self.poll_seconds = poll_seconds
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self._known: Dict[str, int] = {}
+        self._since: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.remote_changes = 0
+        self.poll_failures = 0
+
+    async def _bump(self, key: str, fields: Dict[str, Any]) -> None:
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"v": 1}, "$set": {**fields, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        # This instance already updated its own caches
+        self._known[key] = doc["v"]
+
+    async def publish(self, section_ids: Iterable[str] = (), school_id: Optional[str] = None) -> None:
+        for section_id in section_ids:
+            await self._bump(f"section:{section_id}", {"section_id": section_id, "school_id": school_id})
+        if school_id:
+            await self._bump(f"school:{school_id}", {"section_id": None, "school_id": school_id})
+
+    async def poll(self) -> int:
+        """Apply changes made by other instances; returns how many were applied."""
+        started = datetime.now(timezone.utc)
+        query = {"updated_at": {"$gte": self._since - self.lookback}} if self._since else {}
+        # The first poll runs at startup before any cache is built, so it only
+        # records the current counters
+        first_poll = self._since is None
+        changed = 0
+        async for doc in self.collection.find(query):
+            if self._known.get(doc["_id"]) == doc["v"]:
+                continue
+            self._known[doc["_id"]] = doc["v"]
+            if not first_poll:
+                self.on_change(doc)
+                changed += 1
+        self._since = started
+        self.remote_changes += changed
+        return changed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                self.poll_failures += 1
+                logger.error(f"Cache version poll failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"known": len(self._known), "remote_changes": self.remote_changes,
+                "poll_failures": self.poll_failures, "poll_seconds": self.poll_seconds}
@@ -0,0 +1,199 @@
+"""
+MobileFaceNet (TFLite) face embedding.
+
+TFLite interpreters are not safe to share across threads, so the API keeps a
+pool of preallocated interpreters and every inference checks one out for the
+duration of the call. Callers run these functions in worker threads.
+
+Batches are padded up to one of BATCH_SIZES, and each pool slot keeps one
+interpreter per batch size, so tensors are allocated once per size instead
+of on every invoke whose batch differs from the previous one.
+"""
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("backend.embedding")
+
+INPUT_SIZE = 112
+BATCH_SIZES = (1, 2, 4, 8, 16, 32)
+
+
+class InterpreterPoolTimeout(Exception):
+    """Raised when no interpreter became free within the checkout timeout."""
+
+
+def _padded_size(n: int) -> int:
+    return next((size for size in BATCH_SIZES if size >= n), n)
+
+
+class ShapedInterpreters:
+    """
+    One pool slot: interpreters of the same model, one per batch size, each
+    resized and allocated once when its size is first used. A model whose
+    batch dimension cannot be resized runs one face per invoke.
+    """
+
+    def __init__(self, make_interpreter: Callable[[], Any]):
+        self._make_interpreter = make_interpreter
+        self._by_size: Dict[int, Any] = {}
+        self.fixed_batch = False
+        self.interpreter(1)
+
+    def interpreter(self, batch_size: int):
+        interpreter = self._by_size.get(batch_size)
+        if interpreter is None:
+            interpreter = self._make_interpreter()
+            details = interpreter.get_input_details()[0]
+            if details['shape'][0] != batch_size:
+                interpreter.resize_tensor_input(details['index'], [batch_size, INPUT_SIZE, INPUT_SIZE, 3])
+            interpreter.allocate_tensors()
+            self._by_size[batch_size] = interpreter
+        return interpreter
+
+    def run(self, batch):
+        """Embeddings of a (n, INPUT_SIZE, INPUT_SIZE, 3) batch, one invoke for up to max(BATCH_SIZES) faces."""
+        import numpy as np
+
+        n = len(batch)
+        if n > 1 and not self.fixed_batch:
+            size = _padded_size(n)
+            try:
+                interpreter = self.interpreter(size)
+            except (ValueError, RuntimeError):
+                logger.warning("MobileFaceNet input cannot be resized, embedding faces one by one")
+                self.fixed_batch = True
+            else:
+                if size > n:
+                    batch = np.concatenate([batch, np.zeros((size - n, *batch.shape[1:]), dtype=batch.dtype)])
+                return _invoke(interpreter, batch)[:n]
+        if n > 1:
+            return np.concatenate([_invoke(self.interpreter(1), batch[i:i + 1]) for i in range(n)])
+        return _invoke(self.interpreter(1), batch)
+
+
+class InterpreterPool:
+    def __init__(self, model_path: str, size: int, num_threads: int):
+        import tflite_runtime.interpreter as tflite
+
+        self.model_path = str(model_path)
+        self.size = size
+        self.num_threads = num_threads
+        self._idle: "queue.Queue[ShapedInterpreters]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(ShapedInterpreters(
+                lambda: tflite.Interpreter(model_path=self.model_path, num_threads=num_threads)))
+
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None):
+        start = time.perf_counter()
+        try:
+            interpreter = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise InterpreterPoolTimeout()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            yield interpreter
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(interpreter)
+
+    def warm_up(self) -> None:
+        """Run one dummy inference on every interpreter in the pool."""
+        import numpy as np
+
+        interpreters = [self._idle.get() for _ in range(self.size)]
+        try:
+            for interpreter in interpreters:
+                interpreter.run(np.zeros((1, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32))
+        finally:
+            for interpreter in interpreters:
+                self._idle.put(interpreter)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "threads_per_interpreter": self.num_threads,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "queue_wait_seconds_total": round(self._wait_total, 6),
+                "queue_wait_seconds_max": round(self._wait_max, 6),
+                "queue_wait_seconds_avg": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
+
+
+def preprocess(face_bgr):
+    import numpy as np
+    import cv2
+
+    # Preprocess face for MobileFaceNet (112x112, normalized)
+    face_resized = cv2.resize(face_bgr, (INPUT_SIZE, INPUT_SIZE))
+    return (face_resized.astype(np.float32) - 127.5) / 128.0
+
+
+def _invoke(interpreter, batch):
+    interpreter.set_tensor(interpreter.get_input_details()[0]['index'], batch)
+    interpreter.invoke()
+    return interpreter.get_tensor(interpreter.get_output_details()[0]['index']).copy()
+
+
+def embed_faces(pool: InterpreterPool, faces, timeout: Optional[float] = None, max_batch: int = BATCH_SIZES[-1]):
+    """
+    Generate L2-normalised embeddings for a list of face crops; each chunk of
+    up to max_batch faces is one invoke(). Returns (embeddings, None) or
+    (None, error_code).
+    """
+    try:
+        import numpy as np
+
+        if not faces:
+            return [], None
+        inputs = np.stack([preprocess(f) for f in faces])
+        outputs = []
+        with pool.checkout(timeout) as interpreters:
+            for start in range(0, len(inputs), max_batch):
+                outputs.append(interpreters.run(inputs[start:start + max_batch]))
+
+        embeddings = np.concatenate(outputs).reshape(len(inputs), -1)
+        # Normalize embeddings (L2 normalization)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings = embeddings / norms
+        return embeddings.tolist(), None
+
+    except InterpreterPoolTimeout:
+        return None, "mobilefacenet_busy"
+    except Exception as e:
+        logger.exception("MobileFaceNet embedding error")
+        return None, str(e)
+
+
+def embed_face(pool: InterpreterPool, face_bgr, timeout: Optional[float] = None):
+    """
+    Generate an L2-normalised face embedding. Returns (embedding, None) or
+    (None, error_code).
+    """
+    embeddings, err = embed_faces(pool, [face_bgr], timeout)
+    if embeddings is None:
+        return None, err
+    return embeddings[0], None
@@ -0,0 +1,152 @@
+"""
+Compact storage of face embeddings in student documents.
+
+All embeddings of a student are written as one BSON Binary blob of
+little-endian float32 (or float16) values together with what is needed to
+decode it:
+
+    "face_embeddings": {"format": 1, "model": "mobilefacenet", "model_version": "3f9a0c1b2d4e",
+                        "dim": 128, "count": 5, "dtype": "float32", "data": Binary(...),
+                        "centroid": Binary(...)}
+
+centroid is the normalised mean of the normalised embeddings (float32), used
+to shortlist students before scoring their individual embeddings.
+
+model_version identifies the model file that produced the vectors (see
+model_version()); vectors of different versions are not comparable.
+
+Older documents carry a nested "embeddings" list of floats instead;
+decode_embeddings() reads both, and migrate_to_binary() converts them.
+Vectors without a model_version are attributed to UNTAGGED_MODEL_VERSION.
+"""
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+logger = logging.getLogger("backend.embedding_store")
+
+FORMAT_VERSION = 1
+MODEL_NAME = "mobilefacenet"
+STORAGE_DTYPES = ("float32", "float16")
+# Model version of embeddings stored before versions were recorded; unset means
+# they came from the model currently deployed
+UNTAGGED_MODEL_VERSION = os.getenv("UNTAGGED_EMBEDDING_VERSION") or None
+
+
+def model_version(model_path) -> str:
+    """Short content hash of a model file, overridable with MOBILEFACENET_MODEL_VERSION."""
+    override = os.getenv("MOBILEFACENET_MODEL_VERSION")
+    if override:
+        return override
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _legacy_matrix(rows: Iterable[Any]) -> np.ndarray:
+    # Nested lists from older documents; keep rows matching the first dimension
+    valid = [r for r in rows or [] if isinstance(r, list) and r]
+    if not valid:
+        return np.zeros((0, 0), dtype=np.float32)
+    dim = len(valid[0])
+    return np.asarray([r for r in valid if len(r) == dim], dtype=np.float32)
+
+
+def normalized_centroid(matrix: np.ndarray) -> np.ndarray:
+    """Unit-length mean direction of the L2-normalised rows of matrix."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    rows = matrix[norms[:, 0] > 0] / norms[norms[:, 0] > 0]
+    if not len(rows):
+        return np.zeros((0,), dtype=np.float32)
+    centroid = rows.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return (centroid / norm).astype(np.float32) if norm > 0 else np.zeros((0,), dtype=np.float32)
+
+
+def encode_embeddings(embeddings, dtype: str = "float32", model: str = MODEL_NAME,
+                      version: Optional[str] = None) -> Dict[str, Any]:
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+    matrix = embeddings if isinstance(embeddings, np.ndarray) else _legacy_matrix(embeddings)
+    matrix = np.atleast_2d(matrix)
+    count, dim = (matrix.shape if matrix.size else (0, 0))
+    data = np.ascontiguousarray(matrix, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+    centroid = normalized_centroid(matrix.astype(np.float32)) if count else np.zeros((0,), dtype=np.float32)
+    return {
+        "format": FORMAT_VERSION,
+        "model": model,
+        "model_version": version,
+        "dim": int(dim),
+        "count": int(count),
+        "dtype": dtype,
+        "data": Binary(data),
+        "centroid": Binary(np.ascontiguousarray(centroid, dtype=np.dtype("float32").newbyteorder("<")).tobytes()),
+    }
+
+
+def stored_version(doc: Dict[str, Any]) -> Optional[str]:
+    """Model version of a student's stored embeddings (None: untagged, current model)."""
+    stored = doc.get("face_embeddings") or {}
+    return stored.get("model_version") or UNTAGGED_MODEL_VERSION
+
+
+def decode_embeddings(doc: Dict[str, Any], version: Optional[str] = None) -> np.ndarray:
+    """
+    Return a student's embeddings as a (count, dim) float32 array. With a
+    version, embeddings produced by another model version come back empty.
+    """
+    if version is not None and stored_version(doc) not in (None, version):
+        return np.zeros((0, 0), dtype=np.float32)
+    stored = doc.get("face_embeddings")
+    if stored:
+        if stored.get("format") != FORMAT_VERSION or stored.get("dtype") not in STORAGE_DTYPES:
+            logger.warning(f"Skipping embeddings of student {doc.get('id')} in unknown format")
+            return np.zeros((0, 0), dtype=np.float32)
+        count, dim = stored["count"], stored["dim"]
+        if not count:
+            return np.zeros((0, 0), dtype=np.float32)
+        raw = np.frombuffer(stored["data"], dtype=np.dtype(stored["dtype"]).newbyteorder("<"))
+        return raw.reshape(count, dim).astype(np.float32, copy=False)
+    return _legacy_matrix(doc.get("embeddings"))
+
+
+def decode_centroid(doc: Dict[str, Any], embeddings: np.ndarray) -> np.ndarray:
+    """Stored centroid of a student, or one computed from embeddings when absent or mismatched."""
+    stored = (doc.get("face_embeddings") or {}).get("centroid")
+    if stored and embeddings.size:
+        centroid = np.frombuffer(stored, dtype=np.dtype("float32").newbyteorder("<")).astype(np.float32)
+        if centroid.shape[0] == embeddings.shape[1]:
+            return centroid
+    return normalized_centroid(embeddings) if embeddings.size else np.zeros((0,), dtype=np.float32)
+
+
+def migrate_to_binary(students, batch_size: int = 500, dtype: str = "float32", version: Optional[str] = None) -> int:
+    """
+    Convert legacy list embeddings of a (pymongo) students collection to the
+    binary format in batches. Converted documents lose their "embeddings"
+    field, so an interrupted run can simply be started again.
+    Returns the number of documents converted.
+    """
+    converted = 0
+    query = {"embeddings": {"$exists": True}, "face_embeddings": {"$exists": False}}
+    while True:
+        batch = list(students.find(query, {"_id": 1, "id": 1, "embeddings": 1}).limit(batch_size))
+        if not batch:
+            return converted
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"face_embeddings": encode_embeddings(doc.get("embeddings"), dtype, version=version)}, "$unset": {"embeddings": ""}},
+            )
+            for doc in batch
+        ]
+        students.bulk_write(ops, ordered=False)
+        converted += len(ops)
+        logger.info(f"Converted {converted} student embedding documents")
@@ -0,0 +1,97 @@
+"""
+Cheap face quality checks run between detection and embedding.
+
+Faces that are too small, blurry, badly lit or strongly turned rarely reach
+the match threshold, so they are rejected before MobileFaceNet with a reason
+code. The combined score is also used to rank enrollment images.
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+# Rejection thresholds (face size in full-resolution pixels, sharpness as the
+# variance of the Laplacian of the crop at MobileFaceNet input size, brightness
+# as mean grey level, yaw as nose offset from the eye midpoint per eye distance)
+FACE_MIN_SIZE = int(os.getenv("FACE_MIN_SIZE", "64"))
+FACE_MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", "30"))
+FACE_MIN_BRIGHTNESS = float(os.getenv("FACE_MIN_BRIGHTNESS", "40"))
+FACE_MAX_BRIGHTNESS = float(os.getenv("FACE_MAX_BRIGHTNESS", "220"))
+FACE_MAX_YAW = float(os.getenv("FACE_MAX_YAW", "0.35"))
+FACE_MAX_ROLL = float(os.getenv("FACE_MAX_ROLL", "30"))  # degrees
+
+QUALITY_SIDE = 112  # crops are scored at MobileFaceNet input size
+
+
+@dataclass
+class FaceQuality:
+    score: float  # 0..1, higher is better
+    reason: Optional[str]  # None when the face passes, otherwise a reason code
+    size: int
+    sharpness: float
+    brightness: float
+    yaw: Optional[float] = None
+    roll: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.reason is None
+
+
+def head_pose(keypoints: Optional[Sequence[Point]]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    (yaw, roll) from (right eye, left eye, nose tip) in image pixels. Yaw is
+    0 for a frontal face and grows to about 0.5 in profile; roll is the tilt
+    of the eye line in degrees.
+    """
+    if not keypoints:
+        return None, None
+    (rx, ry), (lx, ly), (nx, _) = keypoints[:3]
+    eye_dist = math.hypot(lx - rx, ly - ry)
+    if eye_dist == 0:
+        return None, None
+    yaw = abs(nx - (rx + lx) / 2) / eye_dist
+    roll = math.degrees(math.atan2(ly - ry, lx - rx))
+    # Eye order depends on the detector's convention; fold the angle into -90..90
+    if roll > 90:
+        roll -= 180
+    elif roll < -90:
+        roll += 180
+    return yaw, abs(roll)
+
+
+def assess(crop, size: int, keypoints: Optional[Sequence[Point]] = None) -> FaceQuality:
+    """Score a BGR face crop; size is the smaller side of the face box at full resolution."""
+    import cv2
+
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, (QUALITY_SIDE, QUALITY_SIDE), interpolation=cv2.INTER_AREA)
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    brightness = float(gray.mean())
+    yaw, roll = head_pose(keypoints)
+
+    if size < FACE_MIN_SIZE:
+        reason = "face_too_small"
+    elif sharpness < FACE_MIN_SHARPNESS:
+        reason = "face_blurry"
+    elif brightness < FACE_MIN_BRIGHTNESS:
+        reason = "face_too_dark"
+    elif brightness > FACE_MAX_BRIGHTNESS:
+        reason = "face_too_bright"
+    elif yaw is not None and yaw > FACE_MAX_YAW:
+        reason = "face_turned"
+    elif roll is not None and roll > FACE_MAX_ROLL:
+        reason = "face_tilted"
+    else:
+        reason = None
+
+    score = (
+        min(1.0, size / (2.0 * FACE_MIN_SIZE))
+        * min(1.0, sharpness / (4.0 * FACE_MIN_SHARPNESS))
+        * (1.0 - abs(brightness - 128.0) / 128.0)
+        * (1.0 - min(1.0, (yaw or 0.0) / (2.0 * FACE_MAX_YAW)))
+    )
+    return FaceQuality(score=score, reason=reason, size=size, sharpness=sharpness,
+                       brightness=brightness, yaw=yaw, roll=roll)
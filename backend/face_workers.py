@@ -0,0 +1,475 @@
+"""
+Face detection off the event loop.
+
+Detection (JPEG decode and a face detector: MediaPipe Face Mesh by default, or a
+box-only MediaPipe/YuNet detector) is CPU bound and not thread safe, so it runs
+in a pool of worker processes. Each worker owns its own detector instance
+created by the pool initializer. This module is kept
+free of FastAPI/Mongo imports so spawned workers start quickly.
+"""
+import os
+# Fix MediaPipe protobuf issues in container environment
+os.environ.setdefault('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION', 'python')
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from face_quality import FaceQuality, assess
+
+logger = logging.getLogger("backend.face_workers")
+
+_WORKER_DETECTOR = None  # per-process single-face detector, set by init_worker
+_WORKER_GROUP_DETECTOR = None  # per-process multi-face detector, created on first group photo
+_WORKER_DETECTOR_KIND = "mesh"
+_WORKER_GROUP_MAX_FACES = 1
+_WORKER_READY = False  # the detector ran a blank frame in init_worker
+
+CROP_MARGIN = 20  # pixels (at full resolution) added around the detected bounding box
+# Longest image side detection works on; larger JPEGs are decoded at 1/2, 1/4
+# or 1/8 scale by libjpeg (0 disables)
+DECODE_TARGET_SIDE = int(os.getenv("FACE_DECODE_TARGET_SIDE", "1280"))
+MIN_CROP_SIDE = 112  # MobileFaceNet input size; crops are taken at a resolution that keeps this
+REDUCTION_FACTORS = (8, 4, 2)
+DETECTOR_KINDS = ("mesh", "mediapipe", "yunet")
+YUNET_MODEL_PATH = os.getenv(
+    "YUNET_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_detection_yunet_2023mar.onnx"),
+)
+
+
+@dataclass
+class DetectedFace:
+    crop: Any  # BGR ndarray
+    box: Tuple[int, int, int, int]  # x1, y1, x2, y2 in the decoded image
+    quality: Optional[FaceQuality] = None
+
+
+class DetectionQueueFull(Exception):
+    """Raised when more detections are pending than the pool accepts."""
+
+
+def create_face_mesh(max_num_faces: int = 1, static_image_mode: bool = True):
+    import mediapipe as mp  # type: ignore
+    try:
+        # Minimal configuration to avoid container issues
+        return mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=static_image_mode,
+            max_num_faces=max_num_faces,
+            refine_landmarks=False,
+            min_detection_confidence=0.3,
+            min_tracking_confidence=0.3
+        )
+    except Exception as e:
+        logger.warning(f"MediaPipe Face Mesh failed with default config, retrying minimal: {e}")
+        return mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=static_image_mode,
+            max_num_faces=max_num_faces,
+            min_detection_confidence=0.3
+        )
+
+
+# ---------- Detectors ----------
+# A detector maps a BGR image to (box, keypoints) pairs, most confident first:
+# box is x1, y1, x2, y2 in pixels (unclamped), keypoints are the right eye, left
+# eye and nose tip in pixels, or None.
+
+Detection = Tuple[Tuple[float, float, float, float], Optional[Tuple[Tuple[float, float], ...]]]
+
+class MeshDetector:
+    """
+    468-landmark Face Mesh; the box is the extent of the landmarks. With
+    tracking=True the mesh runs in video mode and follows faces from the
+    previous frame instead of re-detecting them.
+    """
+    name = "mesh"
+
+    def __init__(self, max_faces: int = 1, tracking: bool = False):
+        self.mesh = create_face_mesh(max_faces, static_image_mode=not tracking)
+
+    def close(self) -> None:
+        self.mesh.close()
+
+    # Mesh landmark indices of the outer eye corners and the nose tip
+    KEYPOINTS = (33, 263, 1)
+
+    def detect(self, img) -> List[Detection]:
+        import numpy as np
+        import cv2
+
+        results = self.mesh.process(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        if not results or not results.multi_face_landmarks:
+            return []
+        h, w = img.shape[:2]
+        detections = []
+        for landmarks in results.multi_face_landmarks:
+            pts = np.array([(lm.x * w, lm.y * h) for lm in landmarks.landmark], dtype=np.float32)
+            box = (pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max())
+            detections.append((box, tuple(tuple(pts[i]) for i in self.KEYPOINTS)))
+        return detections
+
+
+class MediaPipeBoxDetector:
+    """MediaPipe short-range (BlazeFace) face detection: boxes only, no mesh."""
+    name = "mediapipe"
+
+    def __init__(self, max_faces: int = 1):
+        import mediapipe as mp  # type: ignore
+        self.max_faces = max_faces
+        self.detector = mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.3)
+
+    def close(self) -> None:
+        self.detector.close()
+
+    def detect(self, img) -> List[Detection]:
+        import cv2
+
+        results = self.detector.process(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        if not results or not results.detections:
+            return []
+        h, w = img.shape[:2]
+        found = sorted(results.detections, key=lambda d: d.score[0], reverse=True)[:self.max_faces]
+        detections = []
+        for d in found:
+            bb = d.location_data.relative_bounding_box
+            x1, y1 = bb.xmin * w, bb.ymin * h
+            # Keypoints 0-2 are the right eye, left eye and nose tip
+            kps = d.location_data.relative_keypoints
+            keypoints = tuple((kp.x * w, kp.y * h) for kp in kps[:3]) if len(kps) >= 3 else None
+            detections.append(((x1, y1, x1 + bb.width * w, y1 + bb.height * h), keypoints))
+        return detections
+
+
+class YuNetDetector:
+    """OpenCV DNN YuNet face detector loaded from a local ONNX file."""
+    name = "yunet"
+
+    def __init__(self, max_faces: int = 1, model_path: str = YUNET_MODEL_PATH):
+        import cv2
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path}")
+        self.max_faces = max_faces
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), 0.6, 0.3, 5000)
+
+    def detect(self, img) -> List[Detection]:
+        h, w = img.shape[:2]
+        self.detector.setInputSize((w, h))
+        _, faces = self.detector.detect(img)
+        if faces is None:
+            return []
+        # Rows are x, y, w, h, 5 landmark points (right eye, left eye, nose, mouth corners), score
+        faces = sorted(faces, key=lambda f: f[-1], reverse=True)[:self.max_faces]
+        return [
+            ((f[0], f[1], f[0] + f[2], f[1] + f[3]), ((f[4], f[5]), (f[6], f[7]), (f[8], f[9])))
+            for f in faces
+        ]
+
+
+# ---------- Resolution-bounded decode ----------
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the JPEG frame header without decoding."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return (width, height) if width and height else None
+        if marker == 0xD9 or marker == 0xDA:  # EOI / start of scan before any frame header
+            return None
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+def reduction_factor(longest_side: int, target_side: int) -> int:
+    """Largest of 8/4/2 that keeps the longest side at or above target_side."""
+    if target_side <= 0:
+        return 1
+    for factor in REDUCTION_FACTORS:
+        if longest_side // factor >= target_side:
+            return factor
+    return 1
+
+
+class BoundedImage:
+    """
+    An upload decoded near DECODE_TARGET_SIDE for detection. Face crops are
+    taken from the coarsest resolution that still gives MIN_CROP_SIDE pixels,
+    decoding a finer JPEG scale only when a face is too small.
+    Boxes passed to crop() are in full-resolution pixels.
+    """
+
+    def __init__(self, data: bytes, target_side: int = DECODE_TARGET_SIDE):
+        import cv2
+
+        self.data = data
+        self._levels: Dict[int, Any] = {}
+        size = jpeg_size(data)
+        self.is_jpeg = size is not None
+        factor = reduction_factor(max(size), target_side) if size else 1
+        image = self._decode(factor)
+        if image is None and factor != 1:
+            factor, image = 1, self._decode(1)
+        if image is not None and not self.is_jpeg:
+            # No reduced decode for other formats; downscale the full image for detection
+            factor = reduction_factor(max(image.shape[:2]), target_side)
+            if factor != 1:
+                h, w = image.shape[:2]
+                image = cv2.resize(image, (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+                self._levels[factor] = image
+        self.factor = factor
+        self.image = image
+
+    def _decode(self, factor: int):
+        import numpy as np
+        import cv2
+
+        flags = {
+            1: cv2.IMREAD_COLOR,
+            2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4,
+            8: cv2.IMREAD_REDUCED_COLOR_8,
+        }[factor]
+        image = cv2.imdecode(np.frombuffer(self.data, np.uint8), flags)
+        if image is not None:
+            self._levels[factor] = image
+        return image
+
+    @property
+    def full_size(self) -> Tuple[int, int]:
+        h, w = self.image.shape[:2]
+        return w * self.factor, h * self.factor
+
+    def level(self, factor: int):
+        if factor in self._levels:
+            return self._levels[factor]
+        if not self.is_jpeg:
+            return self._levels[1]
+        return self._decode(factor)
+
+    def crop(self, box: Tuple[int, int, int, int]):
+        x1, y1, x2, y2 = box
+        side = min(x2 - x1, y2 - y1)
+        factor = 1
+        for f in (8, 4, 2):
+            if f <= self.factor and side // f >= MIN_CROP_SIDE and (self.is_jpeg or f == self.factor):
+                factor = f
+                break
+        image = self.level(factor)
+        if image is None:
+            image, factor = self.image, self.factor
+        h, w = image.shape[:2]
+        return image[min(y1 // factor, h):min(-(-y2 // factor), h), min(x1 // factor, w):min(-(-x2 // factor), w)].copy()
+
+
+def create_detector(kind: str = "mesh", max_faces: int = 1, tracking: bool = False):
+    """tracking only changes the mesh detector; box detectors run per frame either way."""
+    if kind == "mesh":
+        return MeshDetector(max_faces, tracking=tracking)
+    if kind == "mediapipe":
+        return MediaPipeBoxDetector(max_faces)
+    if kind == "yunet":
+        return YuNetDetector(max_faces)
+    raise ValueError(f"Unknown face detector: {kind} (expected one of {', '.join(DETECTOR_KINDS)})")
+
+
+def init_worker(detector_kind: str = "mesh", group_max_faces: int = 1):
+    global _WORKER_DETECTOR, _WORKER_DETECTOR_KIND, _WORKER_GROUP_MAX_FACES, _WORKER_READY
+    _WORKER_DETECTOR_KIND = detector_kind
+    _WORKER_GROUP_MAX_FACES = group_max_faces
+    try:
+        _WORKER_DETECTOR = create_detector(detector_kind)
+    except Exception as e:
+        logger.error(f"Detection worker {os.getpid()} could not initialize {detector_kind} detector: {e}")
+        _WORKER_DETECTOR = None
+        return
+    # Every worker the pool starts (also replacements after a crash) pays the
+    # detector's first-run cost here, before it takes its first job
+    try:
+        _WORKER_READY = detect_faces(_WORKER_DETECTOR, warm_up_image())[1] in (None, "no_face")
+    except Exception as e:
+        logger.error(f"Detection worker {os.getpid()} warm-up failed: {e}")
+
+
+def worker_ready() -> Tuple[int, bool]:
+    return os.getpid(), _WORKER_READY
+
+
+def detect_faces(detector, image_bytes: bytes):
+    """
+    Detect every face the detector finds and crop each face region.
+    Returns (faces, None) or (None, error_code); an image without faces
+    yields (None, "no_face").
+    """
+    try:
+        upload = BoundedImage(image_bytes)
+        if upload.image is None:
+            return None, "decode_failed"
+
+        detections = detector.detect(upload.image)
+        if not detections:
+            return None, "no_face"
+
+        # Boxes come back at detection scale; crop and report at full resolution
+        scale = upload.factor
+        w, h = upload.full_size
+        faces = []
+        for (bx1, by1, bx2, by2), keypoints in detections:
+            x1 = max(int(bx1 * scale) - CROP_MARGIN, 0)
+            y1 = max(int(by1 * scale) - CROP_MARGIN, 0)
+            x2 = min(int(bx2 * scale) + CROP_MARGIN, w)
+            y2 = min(int(by2 * scale) + CROP_MARGIN, h)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            crop = upload.crop((x1, y1, x2, y2))
+            if crop.size == 0:
+                continue
+            size = int(min(bx2 - bx1, by2 - by1) * scale)
+            faces.append(DetectedFace(crop=crop, box=(x1, y1, x2, y2), quality=assess(crop, size, keypoints)))
+
+        if not faces:
+            return None, "invalid_bbox"
+        return faces, None
+
+    except Exception as e:
+        logger.exception("Face detection error")
+        return None, str(e)
+
+
+def detect_best_face(detector, image_bytes: bytes):
+    """
+    Detect the most confident face with its crop and quality.
+    Returns (DetectedFace, None) or (None, error_code).
+    """
+    faces, err = detect_faces(detector, image_bytes)
+    if faces is None:
+        return None, err
+    return faces[0], None
+
+
+def detect_and_crop(detector, image_bytes: bytes):
+    """
+    Detect the most confident face and crop the face region.
+    Returns (face_bgr, None) or (None, error_code).
+    """
+    face, err = detect_best_face(detector, image_bytes)
+    if face is None:
+        return None, err
+    return face.crop, None
+
+
+def warm_up_image() -> bytes:
+    """A small blank JPEG used to push a detector through its first run."""
+    import numpy as np
+    import cv2
+
+    _, buf = cv2.imencode(".jpg", np.zeros((256, 256, 3), dtype=np.uint8))
+    return buf.tobytes()
+
+
+def detect_in_worker(image_bytes: bytes):
+    if _WORKER_DETECTOR is None:
+        return None, "face_detector_not_available"
+    return detect_best_face(_WORKER_DETECTOR, image_bytes)
+
+
+def detect_all_in_worker(image_bytes: bytes):
+    global _WORKER_GROUP_DETECTOR
+    if _WORKER_GROUP_DETECTOR is None:
+        try:
+            _WORKER_GROUP_DETECTOR = create_detector(_WORKER_DETECTOR_KIND, _WORKER_GROUP_MAX_FACES)
+        except Exception as e:
+            logger.error(f"Detection worker {os.getpid()} could not initialize group detector: {e}")
+            return None, "face_detector_not_available"
+    return detect_faces(_WORKER_GROUP_DETECTOR, image_bytes)
+
+
+class DetectionPool:
+    """
+    ProcessPoolExecutor of detection workers with a bounded number of pending
+    jobs. Workers are spawned (not forked) so MediaPipe never inherits the
+    parent's threads or event loop.
+    """
+
+    def __init__(self, workers: int, queue_size: int, detector_kind: str = "mesh", group_max_faces: int = 1):
+        self.workers = workers
+        self.detector_kind = detector_kind
+        self.group_max_faces = group_max_faces
+        self.max_pending = workers + queue_size
+        self.pending = 0
+        self._executor = None
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.detector_kind, self.group_max_faces),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise DetectionQueueFull()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._ensure_executor(), fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. native crash); start a fresh pool next time
+                logger.error("Detection worker pool broken, restarting")
+                self.shutdown(wait=False)
+                raise
+        finally:
+            self.pending -= 1
+
+    async def detect(self, image_bytes: bytes):
+        try:
+            return await self.run(detect_in_worker, image_bytes)
+        except BrokenProcessPool:
+            return None, "detection_worker_crashed"
+
+    async def detect_all(self, image_bytes: bytes):
+        try:
+            return await self.run(detect_all_in_worker, image_bytes)
+        except BrokenProcessPool:
+            return None, "detection_worker_crashed"
+
+    async def warm_up(self) -> bool:
+        """
+        Start every worker; False if any detector is unavailable. Workers warm
+        up in init_worker, and the executor starts a new process for each
+        submission made while none is idle, so these concurrent submissions
+        start all of them.
+        """
+        try:
+            results = await asyncio.gather(*(self.run(worker_ready) for _ in range(self.workers)))
+        except BrokenProcessPool:
+            return False
+        # A worker that finished its initializer early may answer several of
+        # these; the others were still started and warmed by init_worker
+        return all(ok for _, ok in results)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
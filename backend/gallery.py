@@ -0,0 +1,265 @@
+"""
+In-process cache of per-section face galleries used by attendance matching.
+
+A gallery holds every stored embedding of a section as one contiguous float32
+matrix with L2-normalised rows, so scoring a probe is a single matrix-vector
+product instead of a Python loop over lists of floats.
+
+Each student also has a normalised centroid. With a shortlist size set,
+matching first scores the centroids, exits early when even the best centroid
+is far below the threshold, and only scores the individual embeddings of the
+top-k students, so match cost stays flat as students get more embeddings.
+
+The gallery also records which students have a twin in the same section, so
+the twin conflict flag of a match needs no extra query.
+"""
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from embedding_store import decode_centroid, decode_embeddings
+
+
+def _top_k(sims: np.ndarray, k: int) -> np.ndarray:
+    """
+    Column indices of the k largest values of each row, best first. For the
+    small k of a shortlist, k argmax passes are much faster than
+    np.argpartition along an axis.
+    """
+    sims = sims.copy()
+    rows = np.arange(len(sims))
+    top = np.empty((len(sims), k), dtype=np.intp)
+    for j in range(k):
+        top[:, j] = np.argmax(sims, axis=1)
+        sims[rows, top[:, j]] = -np.inf
+    return top
+
+
+class SectionGallery:
+    """
+    Pre-normalised embedding matrix of one section with a row -> student map.
+    Rows of a student are contiguous; centroids has one row per student in
+    centroid_ids order.
+    """
+
+    # Below this many rows one product over every embedding is cheaper even
+    # with the early exit. A typical section (60 students, 5 embeddings each)
+    # is above it, since probes of unknown faces then stop at the centroids
+    SHORTLIST_MIN_ROWS = 256
+
+    def __init__(self, section_id: str, matrix: np.ndarray, row_student_ids: List[str], names: Dict[str, str],
+                 centroids: Optional[np.ndarray] = None, centroid_ids: Optional[List[str]] = None,
+                 shortlist: int = 0, exit_below: Optional[float] = None, twin_ids: Optional[Set[str]] = None,
+                 shortlist_min_rows: Optional[int] = None):
+        self.section_id = section_id
+        self.matrix = matrix
+        self.row_student_ids = row_student_ids
+        self.names = names
+        self.centroids = centroids if centroids is not None else np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        self.centroid_ids = centroid_ids or []
+        self.shortlist = shortlist
+        self.exit_below = exit_below
+        self.shortlist_min_rows = self.SHORTLIST_MIN_ROWS if shortlist_min_rows is None else shortlist_min_rows
+        self.embedding_stage_probes = 0  # probes scored against shortlisted rows, for tests and benchmarks
+        self.twin_ids = twin_ids or set()
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        for i, sid in enumerate(row_student_ids):
+            start, _ = self._rows.get(sid, (i, i))
+            self._rows[sid] = (start, i + 1)
+        # First row and row count of each centroid's student, for batched gathers
+        self._centroid_starts = np.array([self._rows[sid][0] for sid in self.centroid_ids], dtype=np.intp)
+        self._centroid_counts = np.array([self._rows[sid][1] - self._rows[sid][0] for sid in self.centroid_ids], dtype=np.intp)
+
+    @classmethod
+    def from_students(cls, section_id: str, students: Iterable[Dict[str, Any]],
+                      model_version: Optional[str] = None, shortlist: int = 0,
+                      exit_below: Optional[float] = None,
+                      shortlist_min_rows: Optional[int] = None) -> "SectionGallery":
+        """
+        Only embeddings of model_version (when given) enter the gallery.
+        shortlist is the number of students kept after centroid scoring (0
+        scores every embedding); probes whose best centroid similarity is
+        below exit_below are rejected after the centroid stage. Galleries with
+        fewer than shortlist_min_rows rows (default SHORTLIST_MIN_ROWS) always
+        score every embedding.
+        """
+        blocks: List[np.ndarray] = []
+        row_student_ids: List[str] = []
+        centroids: List[np.ndarray] = []
+        centroid_ids: List[str] = []
+        names: Dict[str, str] = {}
+        twin_groups: Dict[str, str] = {}
+        group_sizes: Counter = Counter()
+        dim = None
+        for s in students:
+            names[s["id"]] = s.get("name")
+            if s.get("twin_group_id"):
+                group_sizes[s["twin_group_id"]] += 1
+                if s.get("has_twin"):
+                    twin_groups[s["id"]] = s["twin_group_id"]
+            embs = decode_embeddings(s, model_version)
+            if not embs.size:
+                continue
+            if dim is None:
+                dim = embs.shape[1]
+            if embs.shape[1] != dim:
+                continue
+            norms = np.linalg.norm(embs, axis=1)
+            embs = embs[norms > 0] / norms[norms > 0, None]
+            if not len(embs):
+                continue
+            blocks.append(embs)
+            row_student_ids.extend([s["id"]] * embs.shape[0])
+            centroids.append(decode_centroid(s, embs))
+            centroid_ids.append(s["id"])
+        # A twin conflicts when another member of its twin group is in the section
+        twin_ids = {sid for sid, group in twin_groups.items() if group_sizes[group] >= 2}
+        if not blocks:
+            return cls(section_id, np.zeros((0, 0), dtype=np.float32), [], names, twin_ids=twin_ids,
+                       shortlist_min_rows=shortlist_min_rows)
+
+        matrix = np.ascontiguousarray(np.concatenate(blocks), dtype=np.float32)
+        return cls(section_id, matrix, row_student_ids, names,
+                   np.ascontiguousarray(np.stack(centroids), dtype=np.float32), centroid_ids,
+                   shortlist, exit_below, twin_ids, shortlist_min_rows)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.matrix.nbytes + self.centroids.nbytes)
+
+    def _two_stage(self, probes: np.ndarray) -> List[Tuple[Optional[str], float]]:
+        """
+        Centroid shortlist, then the best individual embedding of the
+        shortlisted students, for a batch of normalised probes: one product
+        against the centroids, then each probe against only its shortlisted
+        rows, gathered into one (probes, k, rows per student) block padded to
+        the largest student. Probes whose best centroid is below exit_below
+        are answered from the centroid stage and never gathered.
+        """
+        centroid_sims = probes @ self.centroids.T
+        n = np.arange(len(probes))
+        best_centroid = np.argmax(centroid_sims, axis=1)
+        best_centroid_sim = centroid_sims[n, best_centroid]
+        results = [(self.centroid_ids[c], float(sim)) for c, sim in zip(best_centroid, best_centroid_sim)]
+
+        near = n if self.exit_below is None else np.flatnonzero(best_centroid_sim >= self.exit_below)
+        if not len(near):
+            return results
+        top = _top_k(centroid_sims[near], min(self.shortlist, self.centroids.shape[0]))
+        offsets = np.arange(self._centroid_counts.max())
+        present = offsets < self._centroid_counts[top][..., None]
+        rows = np.where(present, self._centroid_starts[top][..., None] + offsets, 0).reshape(len(near), -1)
+        sims = np.matmul(self.matrix[rows], probes[near, :, None])[..., 0]
+        sims[~present.reshape(len(near), -1)] = -np.inf
+        best = np.argmax(sims, axis=1)
+        self.embedding_stage_probes += len(near)
+        for j, i in enumerate(near):
+            results[i] = (self.row_student_ids[rows[j, best[j]]], float(sims[j, best[j]]))
+        return results
+
+    def _use_shortlist(self) -> bool:
+        return 0 < self.shortlist < len(self.centroid_ids) and len(self.row_student_ids) >= self.shortlist_min_rows
+
+    def twin_conflict(self, student_id: Optional[str]) -> bool:
+        return student_id in self.twin_ids
+
+    def __len__(self) -> int:
+        return len(self.row_student_ids)
+
+    def match(self, probe) -> Tuple[Optional[str], float]:
+        """
+        Return (student_id, cosine similarity) of the best matching row,
+        or (None, -1.0) when the gallery is empty or dimensions differ.
+        """
+        if not self.row_student_ids:
+            return None, -1.0
+        vec = np.asarray(probe, dtype=np.float32).ravel()
+        if vec.shape[0] != self.matrix.shape[1]:
+            return None, -1.0
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None, -1.0
+        if self._use_shortlist():
+            return self._two_stage((vec / norm)[None, :])[0]
+        sims = self.matrix @ (vec / norm)
+        best = int(np.argmax(sims))
+        return self.row_student_ids[best], float(sims[best])
+
+    def match_many(self, probes) -> List[Tuple[Optional[str], float]]:
+        """
+        Match several probes at once with matrix-matrix products (against
+        every row, or against the centroids and then the shortlisted rows).
+        Returns one (student_id, similarity) pair per probe, in order.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if not self.row_student_ids or probes.shape[1] != self.matrix.shape[1]:
+            return [(None, -1.0)] * len(probes)
+        norms = np.linalg.norm(probes, axis=1, keepdims=True)
+        valid = norms[:, 0] > 0
+        norms[~valid] = 1.0
+        if self._use_shortlist():
+            matches = self._two_stage(probes / norms)
+            return [m if v else (None, -1.0) for m, v in zip(matches, valid)]
+        sims = (probes / norms) @ self.matrix.T
+        best = np.argmax(sims, axis=1)
+        return [
+            (self.row_student_ids[b], float(sims[i, b])) if valid[i] else (None, -1.0)
+            for i, b in enumerate(best)
+        ]
+
+
+class GalleryCache:
+    """
+    LRU cache of SectionGallery objects bounded by the total size of their
+    matrices. Every section carries a generation counter that is bumped on
+    invalidation, so a gallery built from a read that raced with a write is
+    never stored.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, SectionGallery]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, section_id: str) -> Optional[SectionGallery]:
+        with self._lock:
+            gallery = self._items.get(section_id)
+            if gallery is not None:
+                self._items.move_to_end(section_id)
+            return gallery
+
+    def generation(self, section_id: str) -> int:
+        with self._lock:
+            return self._generations.get(section_id, 0)
+
+    def put(self, gallery: SectionGallery, generation: int) -> bool:
+        with self._lock:
+            if self._generations.get(gallery.section_id, 0) != generation:
+                return False
+            if gallery.nbytes > self.max_bytes:
+                return False
+            old = self._items.pop(gallery.section_id, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._items[gallery.section_id] = gallery
+            self._bytes += gallery.nbytes
+            while self._bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+            return True
+
+    def invalidate(self, *section_ids: str) -> None:
+        with self._lock:
+            for section_id in section_ids:
+                self._generations[section_id] = self._generations.get(section_id, 0) + 1
+                old = self._items.pop(section_id, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sections": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Convert student embeddings stored as nested float lists to the compact binary
+format (see embedding_store.py). Safe to re-run; only unconverted documents
+are touched.
+
+    python migrate_embeddings.py --batch-size 500 [--dtype float16]
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from embedding_store import STORAGE_DTYPES, migrate_to_binary
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dtype", choices=STORAGE_DTYPES, default=os.getenv("EMBEDDING_STORAGE_DTYPE", "float32"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = MongoClient(os.environ['MONGO_URL'])
+    try:
+        students = client[os.environ['DB_NAME']].students
+        converted = migrate_to_binary(students, batch_size=args.batch_size, dtype=args.dtype)
+        logging.info(f"Done: {converted} documents converted to {args.dtype}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+In-process cache of per-section rosters (id, name, roll_no).
+
+Student documents carry their stored embeddings, so reading whole documents
+to list names moves kilobytes per student. Rosters are read with a projection
+of just these fields and cached until a student of the section changes.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+ROSTER_FIELDS = ("id", "name", "roll_no")
+ROSTER_PROJECTION = {"_id": 0, **{f: 1 for f in ROSTER_FIELDS}}
+
+
+class RosterCache:
+    """
+    LRU cache of section rosters. Like the gallery cache, every section has a
+    generation counter bumped on invalidation, so a roster read that raced
+    with a write is never stored.
+    """
+
+    def __init__(self, max_sections: int):
+        self.max_sections = max_sections
+        self._items: "OrderedDict[str, List[Dict[str, Optional[str]]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, section_id: str) -> Optional[List[Dict[str, Optional[str]]]]:
+        with self._lock:
+            roster = self._items.get(section_id)
+            if roster is None:
+                self._misses += 1
+                return None
+            self._items.move_to_end(section_id)
+            self._hits += 1
+            return roster
+
+    def generation(self, section_id: str) -> int:
+        with self._lock:
+            return self._generations.get(section_id, 0)
+
+    def put(self, section_id: str, roster: List[Dict[str, Optional[str]]], generation: int) -> bool:
+        if self.max_sections <= 0:
+            return False
+        with self._lock:
+            if self._generations.get(section_id, 0) != generation:
+                return False
+            self._items[section_id] = roster
+            self._items.move_to_end(section_id)
+            while len(self._items) > self.max_sections:
+                self._items.popitem(last=False)
+            return True
+
+    def invalidate(self, *section_ids: str) -> None:
+        with self._lock:
+            for section_id in section_ids:
+                self._generations[section_id] = self._generations.get(section_id, 0) + 1
+                self._items.pop(section_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sections": len(self._items), "max_sections": self.max_sections,
+                    "hits": self._hits, "misses": self._misses}
@@ -2,12 +2,13 @@ import os
 # Fix MediaPipe protobuf issues in container environment
 os.environ['PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION'] = 'python'
 
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordBearer
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import JSONResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Literal, Dict, Any
+from typing import List, Optional, Literal, Dict, Any, Tuple, Generic, TypeVar, Union
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import jwt
@@ -18,6 +19,29 @@ import uuid
 import logging
 import secrets
 import requests
+import asyncio
+import time
+import base64
+import binascii
+import json
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import threading
+import tempfile
+
+from gallery import GalleryCache, SectionGallery
+from roster import ROSTER_PROJECTION, RosterCache
+from cache_sync import CacheVersions
+from face_workers import DETECTOR_KINDS, DetectionPool, DetectionQueueFull, create_detector, detect_best_face, detect_faces, warm_up_image
+from embedding import InterpreterPool, embed_face, embed_faces
+from embedding_store import UNTAGGED_MODEL_VERSION, decode_embeddings, encode_embeddings, model_version
+from vector_index import IVFIndex, SchoolIndexCache
+from tracker import FaceTracker, Track
+from result_cache import ResultCache, content_key
+from bulk_enrollment import BulkEnrollmentError, EnrollmentArchive, read_roster
+from attendance_buffer import AttendanceBuffer
 
 # Load env
 ROOT_DIR = Path(__file__).parent
@@ -58,7 +82,116 @@ BREVO_API_KEY = os.getenv("BREVO_API_KEY", "")
 BREVO_SENDER_EMAIL = os.getenv("BREVO_SENDER_EMAIL", "")
 BREVO_SENDER_NAME = os.getenv("BREVO_SENDER_NAME", "School Admin")
 
+# Face gallery cache (per-section embedding matrices kept in process memory)
+GALLERY_CACHE_MAX_BYTES = int(os.getenv("GALLERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Section rosters (id, name, roll_no) kept in process memory
+ROSTER_CACHE_SECTIONS = int(os.getenv("ROSTER_CACHE_SECTIONS", "2000"))
+# How often each instance picks up student changes made through other instances
+CACHE_SYNC_SECONDS = float(os.getenv("CACHE_SYNC_SECONDS", "2"))
+# Embeddings (or detection errors) of recent single-face uploads, keyed by content hash
+UPLOAD_CACHE_SIZE = int(os.getenv("UPLOAD_CACHE_SIZE", "512"))
+UPLOAD_CACHE_TTL = float(os.getenv("UPLOAD_CACHE_TTL", "300"))
+
+# School-wide ANN index: embedding buckets scanned per query
+SCHOOL_INDEX_NPROBE = int(os.getenv("SCHOOL_INDEX_NPROBE", "8"))
+
+# Startup warm-up: load both models and run a dummy inference before reporting ready;
+# optionally prebuild the school ANN indexes too
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "false").lower() in ("1", "true", "yes")
+INDEX_WARMUP = os.getenv("INDEX_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Stored embedding precision ("float32" or "float16")
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+
+# Face detection worker processes (0 = detect in a thread of the API process)
+FACE_DETECT_WORKERS = int(os.getenv("FACE_DETECT_WORKERS", str(min(4, os.cpu_count() or 1))))
+FACE_DETECT_QUEUE_SIZE = int(os.getenv("FACE_DETECT_QUEUE_SIZE", "32"))
+GROUP_MAX_FACES = int(os.getenv("GROUP_MAX_FACES", "60"))  # faces detected per classroom photo
+# Face detector used for cropping: "mesh" (468-landmark Face Mesh), "mediapipe"
+# (short-range box detector) or "yunet" (OpenCV DNN, needs YUNET_MODEL_PATH)
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "mesh")
+if FACE_DETECTOR not in DETECTOR_KINDS:
+    raise RuntimeError(f"FACE_DETECTOR must be one of {', '.join(DETECTOR_KINDS)}")
+
+# Reject blurry, tiny, badly lit or turned faces before embedding (see face_quality.py)
+FACE_QUALITY_GATING = os.getenv("FACE_QUALITY_GATING", "true").lower() in ("1", "true", "yes")
+# Enrollment: images accepted per upload, and best-quality faces kept as embeddings
+ENROLL_MAX_IMAGES = int(os.getenv("ENROLL_MAX_IMAGES", "10"))
+ENROLL_KEEP_IMAGES = int(os.getenv("ENROLL_KEEP_IMAGES", "5"))
+# Bulk enrollment: students processed at once, students per insert_many batch,
+# and retries when the detection queue is full
+BULK_ENROLL_CONCURRENCY = int(os.getenv("BULK_ENROLL_CONCURRENCY", "4"))
+BULK_ENROLL_INSERT_BATCH = int(os.getenv("BULK_ENROLL_INSERT_BATCH", "100"))
+BULK_ENROLL_BUSY_RETRIES = int(os.getenv("BULK_ENROLL_BUSY_RETRIES", "5"))
+# Archive images above this uncompressed size are skipped rather than decompressed
+BULK_ENROLL_MAX_IMAGE_BYTES = int(os.getenv("BULK_ENROLL_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+# Write-behind attendance: marks are accepted in memory (journaled to a local
+# file) and flushed in bulk every ATTENDANCE_FLUSH_MS or ATTENDANCE_FLUSH_MAX
+# marks. "Already marked" answers come from this process's memory, so use it
+# when each section is scanned through one API instance.
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ATTENDANCE_FLUSH_MS = int(os.getenv("ATTENDANCE_FLUSH_MS", "500"))
+ATTENDANCE_FLUSH_MAX = int(os.getenv("ATTENDANCE_FLUSH_MAX", "200"))
+ATTENDANCE_JOURNAL_PATH = os.getenv("ATTENDANCE_JOURNAL_PATH", str(ROOT_DIR / "journal" / "attendance.journal"))
+
+# Background jobs (asynchronous and bulk enrollment). Jobs run on their own
+# detection workers and interpreters so live scans never queue behind them
+# (0 shares the live pools); JOB_WORKER=false leaves jobs to other instances.
+# By default there is one background worker and interpreter per concurrently
+# enrolled student, up to half the CPUs (the rest stays with live scans), and
+# the queue holds every image of those students, so a bulk enrollment is
+# spread across the workers instead of retrying on a full queue.
+JOB_WORKER = os.getenv("JOB_WORKER", "true").lower() in ("1", "true", "yes")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_BUSY_RETRY_SECONDS = float(os.getenv("JOB_BUSY_RETRY_SECONDS", "30"))  # requeue delay when detection is busy
+_BACKGROUND_WORKERS_DEFAULT = max(1, min(BULK_ENROLL_CONCURRENCY, (os.cpu_count() or 1) // 2))
+BACKGROUND_DETECT_WORKERS = int(os.getenv("BACKGROUND_DETECT_WORKERS", str(_BACKGROUND_WORKERS_DEFAULT)))
+BACKGROUND_DETECT_QUEUE_SIZE = int(os.getenv("BACKGROUND_DETECT_QUEUE_SIZE", str(BULK_ENROLL_CONCURRENCY * ENROLL_MAX_IMAGES)))
+BACKGROUND_MOBILEFACENET_POOL_SIZE = int(os.getenv("BACKGROUND_MOBILEFACENET_POOL_SIZE", str(_BACKGROUND_WORKERS_DEFAULT)))
+
+# Streaming scan sessions: each session runs its own detector in tracking mode and
+# embeds a face only until its track is identified. Tracking detectors run in
+# the API process (one thread each while a frame is scanned), so at most
+# STREAM_TRACKING_SESSIONS sessions get one; further sessions detect every
+# frame through the detection pool like uploads do.
+STREAM_TRACKING = os.getenv("STREAM_TRACKING", "true").lower() in ("1", "true", "yes")
+STREAM_TRACKING_SESSIONS = int(os.getenv("STREAM_TRACKING_SESSIONS", "2"))
+STREAM_MAX_FACES = int(os.getenv("STREAM_MAX_FACES", "5"))
+STREAM_TRACK_IOU = float(os.getenv("STREAM_TRACK_IOU", "0.3"))
+STREAM_TRACK_MAX_MISSES = int(os.getenv("STREAM_TRACK_MAX_MISSES", "5"))  # frames a lost track is kept
+
+# MobileFaceNet interpreter pool (interpreters are checked out per inference)
+MOBILEFACENET_POOL_SIZE = int(os.getenv("MOBILEFACENET_POOL_SIZE", "2"))
+MOBILEFACENET_NUM_THREADS = int(os.getenv("MOBILEFACENET_NUM_THREADS", "2"))
+MOBILEFACENET_POOL_TIMEOUT = float(os.getenv("MOBILEFACENET_POOL_TIMEOUT", "10"))
+MOBILEFACENET_MAX_BATCH = int(os.getenv("MOBILEFACENET_MAX_BATCH", "32"))
+MOBILEFACENET_MODEL_PATH = ROOT_DIR / 'models' / 'mobilefacenet.tflite'
+# Embeddings are tagged with the version of the model that produced them, and
+# matching only compares vectors of the deployed version
+try:
+    MODEL_VERSION = model_version(MOBILEFACENET_MODEL_PATH)
+except OSError:
+    MODEL_VERSION = None
+
+# Re-embedding of stored face crops after a model change: students per batch,
+# pause between batches, and how long a batch waits for live scanning to go idle
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "50"))
+REEMBED_PAUSE_SECONDS = float(os.getenv("REEMBED_PAUSE_SECONDS", "1"))
+REEMBED_MAX_WAIT_SECONDS = float(os.getenv("REEMBED_MAX_WAIT_SECONDS", "30"))
+FACE_CROP_MAX_SIDE = 256  # retained enrollment crops are stored at most this large
+
 # ---------- Models ----------
+PageItem = TypeVar("PageItem")
+
+class Page(BaseModel, Generic[PageItem]):
+    """A list endpoint called with ?limit=; next_cursor is null on the last page."""
+    items: List[PageItem]
+    next_cursor: Optional[str] = None
+
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
@@ -174,14 +307,46 @@ class Student(BaseModel):
     twin_group_id: Optional[str]
     created_at: datetime
 
-# ---------- Utility functions ----------
-# ---------- Face utilities (MediaPipe Face Mesh + MobileFaceNet TFLite) ----------
-FACE_MESH = None  # MediaPipe Face Mesh initialized on first use
-MOBILEFACENET_MODEL = None  # TFLite model initialized on first use
+# Student reads for API responses never need the stored embeddings
+STUDENT_PROJECTION = {"_id": 0, **{f: 1 for f in Student.model_fields}}
 
-async def _ensure_face_mesh():
-    global FACE_MESH
-    if FACE_MESH is None:
+# ---------- Utility functions ----------
+# ---------- Face utilities (MediaPipe detector + MobileFaceNet TFLite) ----------
+FACE_DETECTOR_LOCAL = None  # in-process detector (pool disabled), initialized on first use
+FACE_DETECTOR_LOCAL_GROUP = None  # in-process multi-face detector, initialized on first use
+MOBILEFACENET_POOL = None  # TFLite interpreter pool initialized on first use
+BACKGROUND_MOBILEFACENET_POOL = None  # interpreters reserved for background jobs
+FACE_DETECTOR_LOCK = threading.Lock()  # MediaPipe graphs are not thread safe
+DETECTION_POOL = DetectionPool(FACE_DETECT_WORKERS, FACE_DETECT_QUEUE_SIZE, FACE_DETECTOR, GROUP_MAX_FACES) if FACE_DETECT_WORKERS > 0 else None
+BACKGROUND_DETECTION_POOL = (
+    DetectionPool(BACKGROUND_DETECT_WORKERS, BACKGROUND_DETECT_QUEUE_SIZE, FACE_DETECTOR, GROUP_MAX_FACES)
+    if FACE_DETECT_WORKERS > 0 and BACKGROUND_DETECT_WORKERS > 0 else None
+)
+GALLERY_CACHE = GalleryCache(GALLERY_CACHE_MAX_BYTES)
+SCHOOL_INDEX = SchoolIndexCache()
+ROSTER_CACHE = RosterCache(ROSTER_CACHE_SECTIONS)
+UPLOAD_CACHE = ResultCache(UPLOAD_CACHE_SIZE, UPLOAD_CACHE_TTL)
+TRACKING_SESSIONS = 0  # scan sessions currently holding an in-process tracking detector
+ATTENDANCE_BUFFER: Optional[AttendanceBuffer] = None  # set at startup when ATTENDANCE_WRITE_BEHIND is on
+# Detection errors that depend only on the upload (others are transient and never cached)
+CACHEABLE_DETECTION_ERRORS = {"decode_failed", "no_face", "invalid_bbox"}
+# Readiness of the warm-up stages; a stage that is not enabled counts as ready
+WARMUP_STATE: Dict[str, str] = {
+    "models": "pending" if MODEL_WARMUP else "disabled",
+    "index": "pending" if INDEX_WARMUP else "disabled",
+}
+MATCH_THRESHOLD = 0.90  # 90%
+# Two-stage matching: students shortlisted by centroid similarity (0 scores every
+# embedding), and how far below the threshold the best centroid may be before
+# the probe is rejected without scoring individual embeddings
+MATCH_SHORTLIST = int(os.getenv("MATCH_SHORTLIST", "8"))
+MATCH_EARLY_EXIT_MARGIN = float(os.getenv("MATCH_EARLY_EXIT_MARGIN", "0.15"))
+# Sections with fewer stored embeddings than this score every embedding
+MATCH_SHORTLIST_MIN_ROWS = int(os.getenv("MATCH_SHORTLIST_MIN_ROWS", str(SectionGallery.SHORTLIST_MIN_ROWS)))
+
+async def _ensure_face_detector():
+    global FACE_DETECTOR_LOCAL
+    if FACE_DETECTOR_LOCAL is None:
         try:
             # Clear any existing MediaPipe imports to avoid conflicts
             import sys
@@ -189,146 +354,252 @@ async def _ensure_face_mesh():
             for module in mediapipe_modules:
                 if module in sys.modules:
                     del sys.modules[module]
-            
-            import mediapipe as mp  # type: ignore
-            
-            # Initialize with minimal configuration to avoid container issues
-            FACE_MESH = mp.solutions.face_mesh.FaceMesh(
-                static_image_mode=True,
-                max_num_faces=1,
-                refine_landmarks=False,  # Disable to reduce complexity
-                min_detection_confidence=0.3,  # Lower threshold
-                min_tracking_confidence=0.3
-            )
-            logger.info("MediaPipe Face Mesh initialized successfully")
+
+            FACE_DETECTOR_LOCAL = create_detector(FACE_DETECTOR)
+            logger.info(f"Face detector '{FACE_DETECTOR}' initialized successfully")
         except Exception as e:
-            logger.warning(f"MediaPipe Face Mesh not available or failed to initialize: {e}")
-            # Try alternative initialization
-            try:
-                import mediapipe as mp
-                FACE_MESH = mp.solutions.face_mesh.FaceMesh(
-                    static_image_mode=True,
-                    max_num_faces=1,
-                    min_detection_confidence=0.3
-                )
-                logger.info("MediaPipe Face Mesh initialized with minimal config")
-            except Exception as e2:
-                logger.error(f"MediaPipe Face Mesh completely failed to initialize: {e2}")
-                FACE_MESH = None
-    return FACE_MESH
+            logger.error(f"Face detector '{FACE_DETECTOR}' failed to initialize: {e}")
+            FACE_DETECTOR_LOCAL = None
+    return FACE_DETECTOR_LOCAL
 
 async def _ensure_mobilefacenet_model():
-    global MOBILEFACENET_MODEL
-    if MOBILEFACENET_MODEL is None:
+    global MOBILEFACENET_POOL
+    if MOBILEFACENET_POOL is None:
         try:
-            import tflite_runtime.interpreter as tflite
-            model_path = ROOT_DIR / 'models' / 'mobilefacenet.tflite'
-            MOBILEFACENET_MODEL = tflite.Interpreter(model_path=str(model_path))
-            MOBILEFACENET_MODEL.allocate_tensors()
-            logger.info("MobileFaceNet TFLite model loaded successfully")
+            model_path = MOBILEFACENET_MODEL_PATH
+            MOBILEFACENET_POOL = InterpreterPool(model_path, MOBILEFACENET_POOL_SIZE, MOBILEFACENET_NUM_THREADS)
+            logger.info(f"MobileFaceNet TFLite model loaded: {MOBILEFACENET_POOL_SIZE} interpreters x {MOBILEFACENET_NUM_THREADS} threads")
         except Exception as e:
             logger.warning(f"MobileFaceNet TFLite model not available or failed to initialize: {e}")
-            MOBILEFACENET_MODEL = None
-    return MOBILEFACENET_MODEL
+            MOBILEFACENET_POOL = None
+    return MOBILEFACENET_POOL
+
+async def _ensure_background_mobilefacenet_model():
+    """Interpreters reserved for jobs; falls back to the shared pool when disabled."""
+    global BACKGROUND_MOBILEFACENET_POOL
+    if BACKGROUND_MOBILEFACENET_POOL_SIZE <= 0:
+        return await _ensure_mobilefacenet_model()
+    if BACKGROUND_MOBILEFACENET_POOL is None:
+        try:
+            model_path = MOBILEFACENET_MODEL_PATH
+            BACKGROUND_MOBILEFACENET_POOL = InterpreterPool(model_path, BACKGROUND_MOBILEFACENET_POOL_SIZE, MOBILEFACENET_NUM_THREADS)
+        except Exception as e:
+            logger.warning(f"Background MobileFaceNet interpreters not available: {e}")
+            BACKGROUND_MOBILEFACENET_POOL = None
+    return BACKGROUND_MOBILEFACENET_POOL
 
-async def _detect_and_crop_face_mesh(image_bytes: bytes):
+async def _detect_face(image_bytes: bytes, background: bool = False):
     """
-    Detect face using MediaPipe Face Mesh and crop the face region
+    Detect the most confident face with the configured FACE_DETECTOR and crop
+    and score it. Returns (DetectedFace, None) or (None, error_code).
+    Runs in the detection worker pool (the background pool for jobs), or in a
+    thread when the pool is disabled, so the event loop keeps serving other
+    requests meanwhile.
     """
-    try:
-        import numpy as np
-        import cv2
-        
-        face_mesh = await _ensure_face_mesh()
-        if face_mesh is None:
-            return None, "face_mesh_not_available"
-            
-        npimg = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-        if img is None:
-            return None, "decode_failed"
-            
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb)
-        
-        if results and results.multi_face_landmarks:
-            landmarks = results.multi_face_landmarks[0]
-            h, w, c = img.shape
-            
-            # Get face bounding box from landmarks
-            x_coords = [landmark.x * w for landmark in landmarks.landmark]
-            y_coords = [landmark.y * h for landmark in landmarks.landmark]
-            
-            x1 = max(int(min(x_coords)) - 20, 0)
-            y1 = max(int(min(y_coords)) - 20, 0)
-            x2 = min(int(max(x_coords)) + 20, w)
-            y2 = min(int(max(y_coords)) + 20, h)
-            
-            if x2 <= x1 or y2 <= y1:
-                return None, "invalid_bbox"
-                
-            face = img[y1:y2, x1:x2]
-            return face, None
-            
-        return None, "no_face"
-        
-    except Exception as e:
-        logger.exception("Face mesh detection error")
-        return None, str(e)
+    pool = BACKGROUND_DETECTION_POOL if background and BACKGROUND_DETECTION_POOL is not None else DETECTION_POOL
+    if pool is not None:
+        try:
+            return await pool.detect(image_bytes)
+        except DetectionQueueFull:
+            raise HTTPException(status_code=503, detail="Face detection is busy, please retry")
+
+    detector = await _ensure_face_detector()
+    if detector is None:
+        return None, "face_detector_not_available"
+
+    def _run():
+        with FACE_DETECTOR_LOCK:
+            return detect_best_face(detector, image_bytes)
+    return await asyncio.to_thread(_run)
+
+async def _embed_upload(image_bytes: bytes):
+    """
+    Detect, gate and embed the main face of an upload. Returns (embedding, None)
+    or (None, error detail). Results that depend only on the bytes are cached
+    by content hash, so retried uploads skip inference.
+    """
+    key = content_key(image_bytes)
+    cached = UPLOAD_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    face, err = await _detect_face(image_bytes)
+    if face is None:
+        result = (None, f"No face detected: {err}" if err else "No face detected")
+        if err in CACHEABLE_DETECTION_ERRORS:
+            UPLOAD_CACHE.put(key, result)
+        return result
+    reason = _quality_reason(face)
+    if reason:
+        result = (None, f"Face quality too low: {reason}")
+        UPLOAD_CACHE.put(key, result)
+        return result
+    emb, e2 = await _embed_face_with_mobilefacenet(face.crop)
+    if not emb:
+        return None, f"No embedding generated: {e2}"
+    UPLOAD_CACHE.put(key, (emb, None))
+    return emb, None
+
+def _quality_reason(face) -> Optional[str]:
+    """Reason code when quality gating rejects a detected face, else None."""
+    if not FACE_QUALITY_GATING or face.quality is None:
+        return None
+    return face.quality.reason
+
+async def _detect_all_faces(image_bytes: bytes):
+    """
+    Detect and crop every face in a photo (up to GROUP_MAX_FACES).
+    Returns (List[DetectedFace], None) or (None, error_code).
+    """
+    global FACE_DETECTOR_LOCAL_GROUP
+    if DETECTION_POOL is not None:
+        try:
+            return await DETECTION_POOL.detect_all(image_bytes)
+        except DetectionQueueFull:
+            raise HTTPException(status_code=503, detail="Face detection is busy, please retry")
+
+    if FACE_DETECTOR_LOCAL_GROUP is None:
+        if await _ensure_face_detector() is None:
+            return None, "face_detector_not_available"
+        FACE_DETECTOR_LOCAL_GROUP = create_detector(FACE_DETECTOR, GROUP_MAX_FACES)
+
+    def _run():
+        with FACE_DETECTOR_LOCK:
+            return detect_faces(FACE_DETECTOR_LOCAL_GROUP, image_bytes)
+    return await asyncio.to_thread(_run)
 
 async def _embed_face_with_mobilefacenet(face_bgr):
     """
-    Generate face embedding using MobileFaceNet TFLite model
+    Generate face embedding using MobileFaceNet TFLite model.
+    Inference runs in a worker thread on an interpreter checked out of the pool.
     """
-    try:
-        import numpy as np
-        import cv2
-        
-        model = await _ensure_mobilefacenet_model()
-        if model is None:
-            return None, "mobilefacenet_not_available"
-            
-        # Preprocess face for MobileFaceNet (112x112, normalized)
-        face_resized = cv2.resize(face_bgr, (112, 112))
-        face_normalized = (face_resized.astype(np.float32) - 127.5) / 128.0
-        face_input = np.expand_dims(face_normalized, axis=0)
-        
-        # Get input and output details
-        input_details = model.get_input_details()
-        output_details = model.get_output_details()
-        
-        # Set input tensor
-        model.set_tensor(input_details[0]['index'], face_input)
-        
-        # Run inference
-        model.invoke()
-        
-        # Get output embedding
-        embedding = model.get_tensor(output_details[0]['index'])
-        embedding = embedding[0]  # Remove batch dimension
-        
-        # Normalize embedding (L2 normalization)
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
-            
-        return embedding.tolist(), None
-        
-    except Exception as e:
-        logger.exception("MobileFaceNet embedding error")
-        return None, str(e)
+    pool = await _ensure_mobilefacenet_model()
+    if pool is None:
+        return None, "mobilefacenet_not_available"
+    return await asyncio.to_thread(embed_face, pool, face_bgr, MOBILEFACENET_POOL_TIMEOUT)
 
-def _cosine_sim(a: List[float], b: List[float]) -> float:
-    import math
-    if not a or not b or len(a) != len(b):
-        return -1.0
-    dot = sum(x*y for x, y in zip(a, b))
-    na = math.sqrt(sum(x*x for x in a))
-    nb = math.sqrt(sum(y*y for y in b))
-    if na == 0 or nb == 0:
-        return -1.0
-    return dot / (na * nb)
+async def _embed_faces_with_mobilefacenet(faces, background: bool = False):
+    """
+    Generate embeddings for several face crops with batched invoke() calls.
+    """
+    pool = await _ensure_background_mobilefacenet_model() if background else await _ensure_mobilefacenet_model()
+    if pool is None:
+        return None, "mobilefacenet_not_available"
+    return await asyncio.to_thread(embed_faces, pool, faces, MOBILEFACENET_POOL_TIMEOUT, MOBILEFACENET_MAX_BATCH)
+
+async def _get_section_gallery(section_id: str) -> SectionGallery:
+    gallery = GALLERY_CACHE.get(section_id)
+    if gallery is not None:
+        return gallery
+    generation = GALLERY_CACHE.generation(section_id)
+    students = await db.students.find(
+        {"section_id": section_id}, {"_id": 0, "id": 1, "name": 1, "has_twin": 1, "twin_group_id": 1, "embeddings": 1, "face_embeddings": 1}
+    ).to_list(None)
+    gallery = SectionGallery.from_students(section_id, students, MODEL_VERSION, shortlist=MATCH_SHORTLIST,
+                                           exit_below=MATCH_THRESHOLD - MATCH_EARLY_EXIT_MARGIN,
+                                           shortlist_min_rows=MATCH_SHORTLIST_MIN_ROWS)
+    GALLERY_CACHE.put(gallery, generation)
+    return gallery
+
+async def _get_section_roster(section_id: str) -> List[Dict[str, Any]]:
+    roster = ROSTER_CACHE.get(section_id)
+    if roster is not None:
+        return roster
+    generation = ROSTER_CACHE.generation(section_id)
+    roster = await db.students.find({"section_id": section_id}, ROSTER_PROJECTION).to_list(None)
+    ROSTER_CACHE.put(section_id, roster, generation)
+    return roster
+
+async def _invalidate_section_galleries(*section_ids: str, school_id: Optional[str] = None) -> None:
+    """
+    Called on every student change, so it also covers the rosters. Other
+    instances drop their copies (and the school index of school_id) when they
+    see the change in db.cache_versions.
+    """
+    GALLERY_CACHE.invalidate(*section_ids)
+    ROSTER_CACHE.invalidate(*section_ids)
+    await CACHE_VERSIONS.publish(section_ids, school_id)
+
+def _apply_remote_change(doc: Dict[str, Any]) -> None:
+    if doc.get("section_id"):
+        GALLERY_CACHE.invalidate(doc["section_id"])
+        ROSTER_CACHE.invalidate(doc["section_id"])
+    elif doc.get("school_id"):
+        SCHOOL_INDEX.invalidate(doc["school_id"])
+
+CACHE_VERSIONS = CacheVersions(db.cache_versions, _apply_remote_change, CACHE_SYNC_SECONDS)
+
+async def _get_school_index(school_id: str) -> Optional[IVFIndex]:
+    index = SCHOOL_INDEX.get(school_id)
+    if index is not None:
+        return index
+    generation = SCHOOL_INDEX.generation(school_id)
+    sections = await db.sections.find({"school_id": school_id}, {"_id": 0, "id": 1}).to_list(None)
+    students = await db.students.find(
+        {"section_id": {"$in": [s["id"] for s in sections]}},
+        {"_id": 0, "id": 1, "name": 1, "section_id": 1, "embeddings": 1, "face_embeddings": 1},
+    ).to_list(None)
+    entries = [(s["id"], {"name": s.get("name"), "section_id": s["section_id"]}, decode_embeddings(s, MODEL_VERSION)) for s in students]
+    index = await asyncio.to_thread(IVFIndex.build, school_id, entries, SCHOOL_INDEX_NPROBE)
+    if index is not None:
+        SCHOOL_INDEX.put(index, generation)
+    return index
+
+async def _warm_up_models() -> bool:
+    if DETECTION_POOL is not None:
+        detector_ok = await DETECTION_POOL.warm_up()
+    else:
+        detector = await _ensure_face_detector()
+        detector_ok = detector is not None and (await _detect_face(warm_up_image()))[1] in (None, "no_face")
+    pool = await _ensure_mobilefacenet_model()
+    if pool is not None:
+        await asyncio.to_thread(pool.warm_up)
+    # Background pools serve jobs, not requests; a failure there does not
+    # make the instance unready
+    if JOB_WORKER:
+        if BACKGROUND_DETECTION_POOL is not None and not await BACKGROUND_DETECTION_POOL.warm_up():
+            logger.warning("Background detection pool warm-up failed")
+        background = await _ensure_background_mobilefacenet_model()
+        if background is not None and background is not pool:
+            await asyncio.to_thread(background.warm_up)
+    return detector_ok and pool is not None
+
+async def _warm_up() -> None:
+    if MODEL_WARMUP:
+        try:
+            start = time.perf_counter()
+            ok = await _warm_up_models()
+            WARMUP_STATE["models"] = "ready" if ok else "failed"
+            logger.info(f"Model warm-up {WARMUP_STATE['models']} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"Model warm-up failed: {e}")
+            WARMUP_STATE["models"] = "failed"
+    if INDEX_WARMUP:
+        try:
+            start = time.perf_counter()
+            schools = await db.schools.find({}, {"_id": 0, "id": 1}).to_list(None)
+            for school in schools:
+                await _get_school_index(school["id"])
+            WARMUP_STATE["index"] = "ready"
+            logger.info(f"Built {len(schools)} school indexes in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"School index warm-up failed: {e}")
+            WARMUP_STATE["index"] = "failed"
 
+def _index_student_added(school_id: Optional[str], doc: dict) -> None:
+    index = SCHOOL_INDEX.touch(school_id) if school_id else None
+    if index is not None:
+        index.add(doc["id"], {"name": doc.get("name"), "section_id": doc["section_id"]}, decode_embeddings(doc, MODEL_VERSION))
+
+def _index_student_updated(school_id: Optional[str], student_id: str, **info) -> None:
+    index = SCHOOL_INDEX.touch(school_id) if school_id else None
+    if index is not None:
+        index.update_info(student_id, **info)
+
+def _index_student_removed(school_id: Optional[str], student_id: str) -> None:
+    index = SCHOOL_INDEX.touch(school_id) if school_id else None
+    if index is not None:
+        index.remove(student_id)
 
 def now_iso():
     return datetime.now(timezone.utc)
@@ -413,6 +684,84 @@ def require_roles(*roles: Role):
         return user
     return role_checker
 
+# ---------- Keyset pagination for list endpoints ----------
+# Lists are ordered by _id. With ?limit=N a page of at most N items is returned
+# as {"<key>": [...], "next_cursor": "..."}; pass next_cursor back as ?cursor=
+# for the following page (null on the last one). Without a limit the whole
+# list keeps its original shape. Either way items are serialized and streamed
+# while the Mongo cursor is read, so memory per request stays bounded.
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+LIST_BATCH_SIZE = int(os.getenv("LIST_BATCH_SIZE", "500"))  # documents per Mongo round trip
+
+def _encode_page_cursor(oid: ObjectId) -> str:
+    return base64.urlsafe_b64encode(oid.binary).decode()
+
+def _decode_page_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _paged_list(collection, query: Dict[str, Any], to_item, limit: Optional[int], cursor: Optional[str],
+                      projection: Optional[Dict[str, Any]] = None, key: Optional[str] = None) -> StreamingResponse:
+    """
+    Stream the documents matching query as to_item(doc) models (the list or
+    Page shape of the route's response_model). key names the envelope field
+    of endpoints that already wrap their list in an object.
+    """
+    if limit is not None and not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    if cursor is not None:
+        query = {"$and": [query, {"_id": {"$gt": _decode_page_cursor(cursor)}}]}
+    if projection is not None:
+        projection = {**projection, "_id": 1}
+    docs = collection.find(query, projection).sort("_id", 1).batch_size(LIST_BATCH_SIZE)
+    if limit is not None:
+        # One extra document tells whether another page follows
+        docs = docs.limit(limit + 1)
+        key = key or "items"
+    # Run the query before the response starts, so a failing query is still a 500
+    try:
+        first = await docs.next()
+    except StopAsyncIteration:
+        first = None
+
+    async def documents():
+        if first is None:
+            return
+        yield first
+        async for doc in docs:
+            yield doc
+
+    async def body():
+        yield f'{{"{key}":[' if key else "["
+        count, last_id, more = 0, None, False
+        try:
+            async for doc in documents():
+                if count == limit:
+                    more = True
+                    break
+                try:
+                    item = to_item(doc).model_dump_json()
+                except (KeyError, ValueError) as e:
+                    # A stored document the response model rejects; keep the list valid
+                    logger.warning(f"Skipping {collection.name} document {doc.get('_id')} in list response: {e}")
+                    continue
+                yield ("," if count else "") + item
+                count, last_id = count + 1, doc["_id"]
+        except Exception:
+            # Headers are sent already; aborting the stream makes the client
+            # see an incomplete response instead of a short list
+            logger.exception(f"Listing {collection.name} failed after {count} items")
+            raise
+        yield "]"
+        if limit is not None:
+            next_cursor = _encode_page_cursor(last_id) if more else None
+            yield f',"next_cursor":{json.dumps(next_cursor)}'
+        yield "}" if key else ""
+
+    return StreamingResponse(body(), media_type="application/json")
+
 # ---------- Routes ----------
 @api.get("/")
 async def api_root():
@@ -426,10 +775,9 @@ async def create_status_check(input: StatusCheckCreate):
     await db.status_checks.insert_one(status_obj.model_dump())
     return status_obj
 
-@api.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    items = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**i) for i in items]
+@api.get("/status", response_model=Union[List[StatusCheck], Page[StatusCheck]])
+async def get_status_checks(limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await _paged_list(db.status_checks, {}, lambda i: StatusCheck(**i), limit, cursor)
 
 # Auth
 @api.post("/auth/login", response_model=TokenResponse)
@@ -454,6 +802,50 @@ async def me(current_user: dict = Depends(get_current_user)):
         created_at=current_user["created_at"],
     )
 
+@api.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@api.get("/health/ready")
+async def health_ready():
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout=2)
+        db_state = "ready"
+    except Exception:
+        db_state = "unavailable"
+    checks = {"db": db_state, **WARMUP_STATE}
+    ready = all(v in ("ready", "disabled") for v in checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "checks": checks})
+
+@api.get("/metrics")
+async def metrics(current: dict = Depends(require_roles('GOV_ADMIN'))):
+    """Pool, queue and cache internals of this instance, for operators only."""
+    return {
+        "inference": {**(MOBILEFACENET_POOL.metrics() if MOBILEFACENET_POOL is not None else {
+            "pool_size": 0,
+            "threads_per_interpreter": MOBILEFACENET_NUM_THREADS,
+        }), "model_version": MODEL_VERSION},
+        "detection": {
+            "detector": FACE_DETECTOR,
+            "workers": FACE_DETECT_WORKERS,
+            "pending": DETECTION_POOL.pending if DETECTION_POOL is not None else 0,
+            "max_pending": DETECTION_POOL.max_pending if DETECTION_POOL is not None else 0,
+        },
+        "gallery_cache": GALLERY_CACHE.stats(),
+        "roster_cache": ROSTER_CACHE.stats(),
+        "cache_sync": CACHE_VERSIONS.stats(),
+        "tracking_sessions": {"active": TRACKING_SESSIONS, "max": STREAM_TRACKING_SESSIONS},
+        "school_index": SCHOOL_INDEX.stats(),
+        "upload_cache": UPLOAD_CACHE.stats(),
+        "attendance_buffer": ATTENDANCE_BUFFER.stats() if ATTENDANCE_BUFFER is not None else None,
+        "jobs": {
+            "running": len(JOB_RUNNING),
+            "concurrency": JOB_CONCURRENCY,
+            "inference": BACKGROUND_MOBILEFACENET_POOL.metrics() if BACKGROUND_MOBILEFACENET_POOL is not None else {"pool_size": 0},
+            "detection_pending": BACKGROUND_DETECTION_POOL.pending if BACKGROUND_DETECTION_POOL is not None else 0,
+        },
+    }
+
 # TEMP: Testing route registration issue
 @api.get("/debug-route-2024")
 async def debug_route_unique():
@@ -524,15 +916,19 @@ async def delete_school(school_id: str, _: dict = Depends(require_roles('GOV_ADM
     section_ids = [s['id'] for s in sections]
     if section_ids:
         await db.students.delete_many({"section_id": {"$in": section_ids}})
+        await db.student_faces.delete_many({"section_id": {"$in": section_ids}})
         await db.sections.delete_many({"id": {"$in": section_ids}})
+        await db.section_day_stats.delete_many({"section_id": {"$in": section_ids}})
+        await _invalidate_section_galleries(*section_ids)
+    SCHOOL_INDEX.invalidate(school_id)
+    await CACHE_VERSIONS.publish(school_id=school_id)
     await db.users.delete_many({"school_id": school_id})
     await db.schools.delete_one({"id": school_id})
     return {"deleted": True}
 
-@api.get("/schools", response_model=List[School])
-async def list_schools(_: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN'))):
-    items = await db.schools.find().to_list(1000)
-    return [School(**i) for i in items]
+@api.get("/schools", response_model=Union[List[School], Page[School]])
+async def list_schools(limit: Optional[int] = None, cursor: Optional[str] = None, _: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN'))):
+    return await _paged_list(db.schools, {}, lambda i: School(**i), limit, cursor)
 
 @api.get("/schools/my", response_model=School)
 async def my_school(current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER'))):
@@ -570,21 +966,20 @@ async def update_section(section_id: str, payload: SectionUpdate, current: dict
 
 # ---------- Student Face Enrollment & Attendance ----------
 # List students
-@api.get("/students", response_model=List[Student])
-async def list_students(section_id: Optional[str] = None, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER'))):
+@api.get("/students", response_model=Union[List[Student], Page[Student]])
+async def list_students(section_id: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER'))):
     query: Dict[str, Any] = {}
     if section_id:
         query["section_id"] = section_id
     if current['role'] in ('SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER') and current.get('school_id'):
         # Ensure sections belong to current school
-        school_sections = await db.sections.find({"school_id": current.get('school_id')}).to_list(10000)
+        school_sections = await db.sections.find({"school_id": current.get('school_id')}, {"_id": 0, "id": 1}).to_list(10000)
         allowed_sec_ids = {s['id'] for s in school_sections}
         if section_id and section_id not in allowed_sec_ids:
             raise HTTPException(status_code=403, detail="Not allowed for this section")
         if not section_id:
             query["section_id"] = {"$in": list(allowed_sec_ids)}
-    items = await db.students.find(query).to_list(10000)
-    return [Student(**i) for i in items]
+    return await _paged_list(db.students, query, lambda i: Student(**i), limit, cursor, projection=STUDENT_PROJECTION)
 
 
 class StudentEnrollResponse(BaseModel):
@@ -594,57 +989,557 @@ class StudentEnrollResponse(BaseModel):
     parent_mobile: Optional[str] = None
     embeddings_count: int
 
-@api.post("/enrollment/students", response_model=StudentEnrollResponse)
-async def enroll_student(
-    name: str = Form(...),
-    section_id: str = Form(...),
-    parent_mobile: Optional[str] = Form(None),
-    has_twin: bool = Form(False),
-    twin_group_id: Optional[str] = Form(None),
-    images: List[UploadFile] = File(...),
-    current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN')),
-):
-    logger.info("Face enrollment endpoint called successfully!")  # Debug log
+async def _enrollment_section(section_id: str, current: dict) -> dict:
     # Validate section scope
-    sec = await db.sections.find_one({"id": section_id})  # noqa: F841
+    sec = await db.sections.find_one({"id": section_id})
     if not sec:
         raise HTTPException(status_code=404, detail="Section not found")
     if current["role"] in ('SCHOOL_ADMIN', 'CO_ADMIN') and sec.get("school_id") != current.get("school_id"):
         raise HTTPException(status_code=403, detail="Not your school section")
+    return sec
 
-    # Process images to embeddings using MediaPipe Face Mesh + MobileFaceNet
-    embeddings: List[List[float]] = []
-    for f in images[:5]:
-        data = await f.read()
-        face, err = await _detect_and_crop_face_mesh(data)
+async def _enrollment_embeddings(uploads: List[bytes], background: bool = False):
+    """
+    Process enrollment images with the face detector + MobileFaceNet: detect
+    all images in parallel, keep the best ENROLL_KEEP_IMAGES faces by quality,
+    then embed the crops in one batch. Jobs pass background=True to run on the
+    background pools.
+    Returns (embeddings, crops, None) or (None, None, error detail).
+    """
+    tasks = [asyncio.ensure_future(_detect_face(data, background)) for data in uploads]
+    try:
+        detections = await asyncio.gather(*tasks)
+    except BaseException:
+        # A full queue fails the whole student; drop its other queued detections
+        # so a retry does not find them still holding the queue
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    faces = []
+    rejected = []
+    for i, (face, err) in enumerate(detections, start=1):
         if face is None:
             logger.warning(f"Face detection failed for image: {err}")
+            rejected.append(f"image {i}: {err}")
             continue
-        emb, e2 = await _embed_face_with_mobilefacenet(face)
-        if emb:
-            embeddings.append(emb)
-        else:
-            logger.warning(f"Face embedding failed: {e2}")
-    if len(embeddings) < 1:
-        raise HTTPException(status_code=400, detail="No face embeddings could be extracted")
-
-    sid = str(uuid.uuid4())
-    student_code = sid[:8]
-    doc = {
+        reason = _quality_reason(face)
+        if reason:
+            rejected.append(f"image {i}: {reason}")
+            continue
+        faces.append(face)
+    faces.sort(key=lambda f: f.quality.score if f.quality else 0.0, reverse=True)
+    faces = faces[:ENROLL_KEEP_IMAGES]
+    if faces:
+        embs, e2 = await _embed_faces_with_mobilefacenet([f.crop for f in faces], background)
+        if embs:
+            return embs, [f.crop for f in faces], None
+        logger.warning(f"Face embedding failed: {e2}")
+    detail = "No face embeddings could be extracted"
+    if rejected:
+        detail += f" ({', '.join(rejected)})"
+    return None, None, detail
+
+def _encode_face_crop(crop) -> bytes:
+    import cv2
+
+    h, w = crop.shape[:2]
+    scale = FACE_CROP_MAX_SIDE / max(h, w)
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return buf.tobytes() if ok else b""
+
+async def _store_face_crops(students: List[Tuple[dict, list]]) -> None:
+    """
+    Keep the enrollment face crops of (student doc, crops) pairs in
+    db.student_faces so embeddings can be recomputed after a model change.
+    """
+    def _encode():
+        return [
+            {"student_id": doc["id"], "section_id": doc["section_id"], "index": i,
+             "image": Binary(_encode_face_crop(crop)), "created_at": now_iso()}
+            for doc, crops in students for i, crop in enumerate(crops)
+        ]
+    faces = await asyncio.to_thread(_encode)
+    if faces:
+        await db.student_faces.insert_many(faces, ordered=False)
+
+def _enrolled_student_doc(name: str, section_id: str, embeddings, student_id: Optional[str] = None,
+                          roll_no: Optional[str] = None, parent_mobile: Optional[str] = None,
+                          has_twin: bool = False, twin_group_id: Optional[str] = None) -> dict:
+    sid = student_id or str(uuid.uuid4())
+    return {
         "id": sid,
         "name": name,
-        "student_code": student_code,
-        "roll_no": None,
+        "student_code": roll_no or sid[:8],
+        "roll_no": roll_no,
         "section_id": section_id,
         "parent_mobile": parent_mobile,
         "has_twin": has_twin,
         "twin_group_id": twin_group_id,
-        "embeddings": embeddings,
+        "face_embeddings": encode_embeddings(embeddings, EMBEDDING_STORAGE_DTYPE, version=MODEL_VERSION),
         "created_at": now_iso(),
     }
+
+@api.post("/enrollment/students", response_model=StudentEnrollResponse)
+async def enroll_student(
+    name: str = Form(...),
+    section_id: str = Form(...),
+    parent_mobile: Optional[str] = Form(None),
+    has_twin: bool = Form(False),
+    twin_group_id: Optional[str] = Form(None),
+    images: List[UploadFile] = File(...),
+    current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN')),
+):
+    logger.info("Face enrollment endpoint called successfully!")  # Debug log
+    sec = await _enrollment_section(section_id, current)
+
+    uploads = [await f.read() for f in images[:ENROLL_MAX_IMAGES]]
+    embeddings, crops, err = await _enrollment_embeddings(uploads)
+    if embeddings is None:
+        raise HTTPException(status_code=400, detail=err)
+
+    doc = _enrolled_student_doc(name, section_id, embeddings, parent_mobile=parent_mobile,
+                                has_twin=has_twin, twin_group_id=twin_group_id)
+    sid = doc["id"]
     await db.students.insert_one(doc)
+    await _store_face_crops([(doc, crops)])
+    await _reset_day_totals(section_id)
+    await _invalidate_section_galleries(section_id, school_id=sec.get("school_id"))
+    _index_student_added(sec.get("school_id"), doc)
     return StudentEnrollResponse(id=sid, name=name, section_id=section_id, parent_mobile=parent_mobile, embeddings_count=len(embeddings))
 
+# ---------- Background jobs ----------
+# Jobs are documents in db.jobs; uploads they need are kept in GridFS until the
+# job finishes. A worker task claims queued jobs (or running jobs whose lease
+# expired, e.g. after a crash) and runs up to JOB_CONCURRENCY at a time on the
+# background inference pools.
+class JobStatus(BaseModel):
+    id: str
+    type: str
+    status: Literal['queued', 'running', 'completed', 'failed']
+    school_id: Optional[str] = None
+    section_id: Optional[str] = None
+    total: int = 0
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    errors: List[Dict[str, Any]] = []
+    result: Optional[Dict[str, Any]] = None
+    detail: Optional[str] = None
+    status_code: Optional[int] = None  # HTTP status of the error that failed or requeued the job
+    retryable: bool = False  # the last error was transient (detection busy)
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+class JobFailed(Exception):
+    """A job cannot complete; the message is reported as the job detail."""
+
+JOB_UPLOADS = AsyncIOMotorGridFSBucket(db, bucket_name="job_uploads")
+JOB_WAKEUP = asyncio.Event()
+JOB_RUNNING: set = set()  # job tasks of this instance
+
+async def _store_job_upload(filename: str, source) -> Any:
+    """Store an upload (bytes or file object) in GridFS, streaming file objects in chunks."""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return await JOB_UPLOADS.upload_from_stream(filename, source)
+
+async def _read_job_upload(file_id) -> bytes:
+    stream = await JOB_UPLOADS.open_download_stream(file_id)
+    return await stream.read()
+
+async def _create_job(job_type: str, current: dict, upload_ids: Optional[List[Any]] = None, **fields) -> dict:
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "status": "queued",
+        "school_id": current.get("school_id"),
+        "created_by": current["id"],
+        "upload_ids": upload_ids or [],
+        "attempts": 0,
+        "total": 0,
+        "processed": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "errors": [],
+        "created_at": now_iso(),
+        "updated_at": now_iso(),
+        **fields,
+    }
+    await db.jobs.insert_one(job)
+    JOB_WAKEUP.set()
+    return job
+
+async def _update_job(job_id: str, update: Dict[str, Any]) -> None:
+    """Apply a progress update and renew the job's lease."""
+    now = now_iso()
+    update.setdefault("$set", {}).update({"updated_at": now, "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS)})
+    await db.jobs.update_one({"id": job_id}, update)
+
+async def _finish_job(job: dict, status: str, detail: Optional[str] = None, result: Optional[Dict[str, Any]] = None,
+                      status_code: Optional[int] = None, retryable: bool = False) -> None:
+    await db.jobs.update_one({"id": job["id"]}, {"$set": {
+        "status": status, "detail": detail, "result": result, "status_code": status_code, "retryable": retryable,
+        "updated_at": now_iso(), "finished_at": now_iso(), "upload_ids": [],
+    }})
+    for file_id in job.get("upload_ids", []):
+        try:
+            await JOB_UPLOADS.delete(file_id)
+        except Exception as e:
+            logger.warning(f"Could not delete upload {file_id} of job {job['id']}: {e}")
+
+async def _claim_job() -> Optional[dict]:
+    now = now_iso()
+    # Jobs whose lease ran out too often are given up on
+    abandoned = await db.jobs.find(
+        {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}}, {"_id": 0}
+    ).to_list(100)
+    for job in abandoned:
+        await _finish_job(job, "failed", f"Job abandoned after {job['attempts']} attempts")
+    return await db.jobs.find_one_and_update(
+        {
+            # A requeued job carries a lease until which it is not retried
+            "$or": [{"status": "queued", "lease_until": {"$not": {"$gt": now}}},
+                    {"status": "running", "lease_until": {"$lt": now}}],
+            "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+        },
+        {"$set": {"status": "running", "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS), "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def _run_job(job: dict) -> None:
+    handler = JOB_HANDLERS.get(job["type"])
+    try:
+        if handler is None:
+            raise JobFailed(f"Unknown job type: {job['type']}")
+        await _finish_job(job, "completed", result=await handler(job))
+    except (JobFailed, BulkEnrollmentError) as e:
+        await _finish_job(job, "failed", str(e))
+    except HTTPException as e:
+        # Helpers shared with the endpoints report errors as HTTPException;
+        # a full detection queue is transient and the job is retried later
+        retryable = e.status_code == 503
+        if retryable and job.get("attempts", 0) < JOB_MAX_ATTEMPTS:
+            now = now_iso()
+            await db.jobs.update_one({"id": job["id"]}, {"$set": {
+                "status": "queued", "detail": e.detail, "status_code": e.status_code, "retryable": True,
+                "updated_at": now, "lease_until": now + timedelta(seconds=JOB_BUSY_RETRY_SECONDS),
+            }})
+        else:
+            await _finish_job(job, "failed", e.detail, status_code=e.status_code, retryable=retryable)
+    except asyncio.CancelledError:
+        # Shutting down: the lease expires and another worker picks the job up
+        raise
+    except Exception as e:
+        logger.exception(f"Job {job['id']} ({job['type']}) failed")
+        await _finish_job(job, "failed", str(e))
+
+async def _job_worker() -> None:
+    while True:
+        JOB_WAKEUP.clear()
+        try:
+            while len(JOB_RUNNING) < JOB_CONCURRENCY:
+                job = await _claim_job()
+                if job is None:
+                    break
+                task = asyncio.create_task(_run_job(job))
+                JOB_RUNNING.add(task)
+                task.add_done_callback(lambda t: (JOB_RUNNING.discard(t), JOB_WAKEUP.set()))
+        except Exception as e:
+            logger.error(f"Job worker could not claim jobs: {e}")
+        try:
+            await asyncio.wait_for(JOB_WAKEUP.wait(), JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+@api.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, current: dict = Depends(get_current_user)):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current["role"] != 'GOV_ADMIN' and job.get("school_id") != current.get("school_id"):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return JobStatus(**job)
+
+# ---------- Asynchronous single-student enrollment ----------
+@api.post("/enrollment/students/jobs", response_model=JobStatus, status_code=202)
+async def enroll_student_job(
+    name: str = Form(...),
+    section_id: str = Form(...),
+    parent_mobile: Optional[str] = Form(None),
+    has_twin: bool = Form(False),
+    twin_group_id: Optional[str] = Form(None),
+    images: List[UploadFile] = File(...),
+    current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN')),
+):
+    """
+    Same as /enrollment/students, but the images are stored and processed by
+    the job worker; poll /api/jobs/{id} for the outcome (result.student_id).
+    """
+    await _enrollment_section(section_id, current)
+    upload_ids = [await _store_job_upload(f.filename or "image.jpg", f.file) for f in images[:ENROLL_MAX_IMAGES]]
+    job = await _create_job(
+        "enrollment", current, upload_ids=upload_ids, section_id=section_id, total=1,
+        # The student id is fixed up front so a retried job never enrolls twice
+        student={"id": str(uuid.uuid4()), "name": name, "parent_mobile": parent_mobile,
+                 "has_twin": has_twin, "twin_group_id": twin_group_id},
+    )
+    return JobStatus(**job)
+
+async def _run_enrollment_job(job: dict) -> Dict[str, Any]:
+    student = job["student"]
+    existing = await db.students.find_one({"id": student["id"]}, {"_id": 0, "id": 1, "face_embeddings.count": 1})
+    if existing:
+        return {"student_id": student["id"], "embeddings_count": existing.get("face_embeddings", {}).get("count", 0)}
+
+    sec = await db.sections.find_one({"id": job["section_id"]})
+    if not sec:
+        raise JobFailed("Section not found")
+    uploads = [await _read_job_upload(file_id) for file_id in job["upload_ids"]]
+    embeddings, crops, err = await _enrollment_embeddings(uploads, background=True)
+    if embeddings is None:
+        await _update_job(job["id"], {"$inc": {"processed": 1, "failed": 1}})
+        raise JobFailed(err)
+
+    doc = _enrolled_student_doc(student["name"], job["section_id"], embeddings, student_id=student["id"],
+                                parent_mobile=student.get("parent_mobile"), has_twin=student.get("has_twin", False),
+                                twin_group_id=student.get("twin_group_id"))
+    await db.students.insert_one(doc)
+    await _store_face_crops([(doc, crops)])
+    await _reset_day_totals(job["section_id"])
+    await _invalidate_section_galleries(job["section_id"], school_id=sec.get("school_id"))
+    _index_student_added(sec.get("school_id"), doc)
+    await _update_job(job["id"], {"$inc": {"processed": 1, "succeeded": 1}})
+    return {"student_id": doc["id"], "embeddings_count": len(embeddings)}
+
+# ---------- Bulk enrollment (ZIP of image folders + CSV roster) ----------
+async def _bulk_enroll_student(archive: EnrollmentArchive, row: dict, section_id: str, student_id: str):
+    """Returns ((student doc, crops), None) or (None, error detail) for one roster row."""
+    if not row["name"]:
+        return None, "Missing name"
+    uploads = await asyncio.to_thread(lambda: list(archive.images(row["folder"], ENROLL_MAX_IMAGES)))
+    if not uploads:
+        if archive.oversized.get(row["folder"]):
+            return None, f"Images in folder '{row['folder']}' exceed {BULK_ENROLL_MAX_IMAGE_BYTES // (1024 * 1024)} MB"
+        return None, f"No images found in folder '{row['folder']}'"
+    for attempt in range(BULK_ENROLL_BUSY_RETRIES + 1):
+        try:
+            embeddings, crops, err = await _enrollment_embeddings(uploads, background=True)
+            break
+        except HTTPException as e:
+            # Detection queue full: back off instead of failing the student
+            if e.status_code != 503 or attempt == BULK_ENROLL_BUSY_RETRIES:
+                return None, e.detail
+            await asyncio.sleep(0.5 * (attempt + 1))
+    if embeddings is None:
+        return None, err
+    doc = _enrolled_student_doc(row["name"], section_id, embeddings, student_id=student_id, roll_no=row["roll_no"],
+                                parent_mobile=row["parent_mobile"], has_twin=row["has_twin"],
+                                twin_group_id=row["twin_group_id"])
+    return (doc, crops), None
+
+async def _run_bulk_enrollment(job: dict) -> Dict[str, Any]:
+    section_id = job["section_id"]
+    sec = await db.sections.find_one({"id": section_id})
+    if not sec:
+        raise JobFailed("Section not found")
+
+    # The archive is read member by member, which needs a seekable local file
+    with tempfile.NamedTemporaryFile(prefix="bulk_enroll_", suffix=".zip") as local:
+        await JOB_UPLOADS.download_to_stream(job["archive_id"], local)
+        local.flush()
+        # Opening reads the central directory, which is large for big archives
+        archive = await asyncio.to_thread(EnrollmentArchive, local.name, BULK_ENROLL_MAX_IMAGE_BYTES)
+        try:
+            if job.get("roster_id"):
+                roster = await _read_job_upload(job["roster_id"])
+            else:
+                roster = await asyncio.to_thread(archive.roster)
+            rows = read_roster(roster)
+            await _update_job(job["id"], {"$set": {"total": len(rows)}})
+
+            sem = asyncio.Semaphore(BULK_ENROLL_CONCURRENCY)
+
+            async def one(row, student_id):
+                async with sem:
+                    try:
+                        student, err = await _bulk_enroll_student(archive, row, section_id, student_id)
+                    except Exception as e:
+                        logger.exception(f"Bulk enrollment of roster row {row['row']} failed")
+                        student, err = None, str(e)
+                    return row, student, err
+
+            # Students are processed concurrently; writes and progress go out in
+            # batches, and a resumed job continues after the last finished batch
+            for start in range(job.get("next_row", 0), len(rows), BULK_ENROLL_INSERT_BATCH):
+                batch = rows[start:start + BULK_ENROLL_INSERT_BATCH]
+                # Student ids derive from the job and row, so a batch replayed after a crash is not enrolled twice
+                ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{job['id']}:{row['row']}")) for row in batch]
+                done = {d["id"] for d in await db.students.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))}
+                results = await asyncio.gather(*(one(row, sid) for row, sid in zip(batch, ids) if sid not in done))
+                enrolled = [(row, student) for row, student, _ in results if student is not None]
+                errors = [{"row": row["row"], "name": row["name"], "error": err} for row, student, err in results if student is None]
+                docs = [doc for _, (doc, _) in enrolled]
+                if docs:
+                    try:
+                        await db.students.insert_many(docs, ordered=False)
+                    except BulkWriteError as e:
+                        unsaved = {w["index"] for w in e.details.get("writeErrors", [])}
+                        errors += [{"row": row["row"], "name": row["name"], "error": "Could not save student"}
+                                   for i, (row, _) in enumerate(enrolled) if i in unsaved]
+                        docs = [doc for i, doc in enumerate(docs) if i not in unsaved]
+                    saved = {doc["id"] for doc in docs}
+                    await _store_face_crops([student for _, student in enrolled if student[0]["id"] in saved])
+                    for doc in docs:
+                        _index_student_added(sec.get("school_id"), doc)
+                    await _reset_day_totals(section_id)
+                    await _invalidate_section_galleries(section_id, school_id=sec.get("school_id"))
+                await _update_job(job["id"], {
+                    "$inc": {"processed": len(batch), "succeeded": len(docs) + len(done), "failed": len(errors)},
+                    "$push": {"errors": {"$each": errors}},
+                    "$set": {"next_row": start + len(batch)},
+                })
+        finally:
+            archive.close()
+    return {"rows": len(rows)}
+
+@api.post("/enrollment/bulk", response_model=JobStatus, status_code=202)
+async def bulk_enroll_students(
+    section_id: str = Form(...),
+    archive: UploadFile = File(...),
+    roster: Optional[UploadFile] = File(None),
+    current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN')),
+):
+    """
+    Enroll many students at once from a ZIP archive with one folder of face
+    images per student and a CSV roster (see bulk_enrollment.py). The upload
+    is processed by the job worker; poll /api/jobs/{id} for progress and the
+    per-student error report.
+    """
+    await _enrollment_section(section_id, current)
+    archive_id = await _store_job_upload(archive.filename or "archive.zip", archive.file)
+    upload_ids = [archive_id]
+    roster_id = None
+    if roster is not None:
+        roster_id = await _store_job_upload(roster.filename or "roster.csv", roster.file)
+        upload_ids.append(roster_id)
+    job = await _create_job("bulk_enrollment", current, upload_ids=upload_ids, section_id=section_id,
+                            archive_id=archive_id, roster_id=roster_id)
+    return JobStatus(**job)
+
+# ---------- Re-embedding after a model change ----------
+def _stale_embeddings_query() -> dict:
+    """Students whose stored embeddings were not produced by the deployed model."""
+    if UNTAGGED_MODEL_VERSION in (None, MODEL_VERSION):
+        # Untagged embeddings count as current; null also matches a missing field
+        return {"face_embeddings.model_version": {"$nin": [MODEL_VERSION, None]}}
+    return {
+        "face_embeddings.model_version": {"$ne": MODEL_VERSION},
+        "$or": [{"face_embeddings": {"$exists": True}}, {"embeddings": {"$exists": True}}],
+    }
+
+def _live_inference_busy() -> bool:
+    if DETECTION_POOL is not None and DETECTION_POOL.pending > 0:
+        return True
+    return MOBILEFACENET_POOL is not None and MOBILEFACENET_POOL.metrics()["in_use"] > 0
+
+async def _reembed_throttle() -> None:
+    await asyncio.sleep(REEMBED_PAUSE_SECONDS)
+    # Yield to live scanning while it is busy (bounded, so the job still progresses)
+    waited = 0.0
+    while _live_inference_busy() and waited < REEMBED_MAX_WAIT_SECONDS:
+        await asyncio.sleep(0.5)
+        waited += 0.5
+
+async def _run_reembed(job: dict) -> Dict[str, Any]:
+    """
+    Recompute the embeddings of every student with stale embeddings from the
+    stored enrollment crops, in batches on the background interpreters.
+    Converted students drop out of the query and the job records the last
+    student seen, so an interrupted run resumes where it stopped.
+    """
+    import numpy as np
+    import cv2
+
+    if MODEL_VERSION is None:
+        raise JobFailed("MobileFaceNet model not available")
+    query = _stale_embeddings_query()
+    if not job.get("total"):
+        await _update_job(job["id"], {"$set": {"total": await db.students.count_documents(query)}})
+    last_id = job.get("last_id")
+    while True:
+        batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        students = await db.students.find(batch_query, {"_id": 1, "id": 1, "section_id": 1}).sort("_id", 1).to_list(REEMBED_BATCH_SIZE)
+        if not students:
+            break
+        await _reembed_throttle()
+
+        crops: Dict[str, list] = {}
+        async for face in db.student_faces.find({"student_id": {"$in": [s["id"] for s in students]}}, {"_id": 0}).sort("index", 1):
+            crops.setdefault(face["student_id"], []).append(face["image"])
+
+        def _decode():
+            return {
+                sid: [img for img in (cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) for data in images) if img is not None]
+                for sid, images in crops.items()
+            }
+        decoded = await asyncio.to_thread(_decode)
+        owners = [sid for sid, images in decoded.items() for _ in images]
+        errors = [{"student_id": s["id"], "error": "No stored face crops; re-enroll the student"} for s in students if not decoded.get(s["id"])]
+
+        ops = []
+        if owners:
+            embs, err = await _embed_faces_with_mobilefacenet([img for images in decoded.values() for img in images], background=True)
+            if embs is None:
+                # Nothing advanced; the job is retried from last_id
+                raise RuntimeError(f"Re-embedding failed: {err}")
+            by_student: Dict[str, list] = {}
+            for sid, emb in zip(owners, embs):
+                by_student.setdefault(sid, []).append(emb)
+            ops = [
+                UpdateOne({"_id": s["_id"]}, {"$set": {"face_embeddings": encode_embeddings(
+                    by_student[s["id"]], EMBEDDING_STORAGE_DTYPE, version=MODEL_VERSION)}})
+                for s in students if s["id"] in by_student
+            ]
+            await db.students.bulk_write(ops, ordered=False)
+            sections = list({s["section_id"] for s in students if s["id"] in by_student})
+            await _invalidate_section_galleries(*sections)
+            for school_id in await db.sections.distinct("school_id", {"id": {"$in": sections}}):
+                SCHOOL_INDEX.invalidate(school_id)
+                await CACHE_VERSIONS.publish(school_id=school_id)
+
+        last_id = students[-1]["_id"]
+        await _update_job(job["id"], {
+            "$inc": {"processed": len(students), "succeeded": len(ops), "failed": len(errors)},
+            "$push": {"errors": {"$each": errors}},
+            "$set": {"last_id": last_id},
+        })
+    return {"model_version": MODEL_VERSION, "remaining": await db.students.count_documents(query)}
+
+@api.post("/admin/reembed", response_model=JobStatus, status_code=202)
+async def start_reembed(current: dict = Depends(require_roles('GOV_ADMIN'))):
+    """
+    Re-embed all students whose embeddings come from another model version
+    (after models/mobilefacenet.tflite was replaced). Until a student is
+    converted, matching ignores their old vectors.
+    """
+    if MODEL_VERSION is None:
+        raise HTTPException(status_code=503, detail="MobileFaceNet model not available")
+    job = await _create_job("reembed", current, model_version=MODEL_VERSION)
+    return JobStatus(**job)
+
+JOB_HANDLERS = {
+    "enrollment": _run_enrollment_job,
+    "bulk_enrollment": _run_bulk_enrollment,
+    "reembed": _run_reembed,
+}
+
 # Test route to debug route registration
 @api.get("/test-route")
 async def test_route():
@@ -670,10 +1565,18 @@ async def simple_students_test():
 async def options_students_enroll():
     return {"ok": True}
 
+@api.options("/enrollment/bulk")
+async def options_enrollment_bulk():
+    return {"ok": True}
+
 @api.options("/attendance/mark")
 async def options_attendance_mark():
     return {"ok": True}
 
+@api.options("/attendance/mark-group")
+async def options_attendance_mark_group():
+    return {"ok": True}
+
 class AttendanceMarkResponse(BaseModel):
     status: str
     student_id: Optional[str] = None
@@ -681,12 +1584,7 @@ class AttendanceMarkResponse(BaseModel):
     similarity: Optional[float] = None
     twin_conflict: bool = False
 
-@api.post("/attendance/mark", response_model=AttendanceMarkResponse)
-async def mark_attendance(
-    image: UploadFile = File(...),
-    section_id: Optional[str] = Form(None),
-    current: dict = Depends(require_roles('TEACHER')),
-):
+async def _resolve_teacher_section(section_id: Optional[str], current: dict) -> str:
     # Determine section to mark against: provided or teacher's default
     chosen_section = section_id or current.get("section_id")
     if not chosen_section:
@@ -695,63 +1593,515 @@ async def mark_attendance(
     sec = await db.sections.find_one({"id": chosen_section})
     if not sec or sec.get("school_id") != current.get("school_id"):
         raise HTTPException(status_code=403, detail="Invalid section for this teacher")
+    return chosen_section
+
+# ---------- Per-section daily attendance counters ----------
+# db.section_day_stats holds one small document per section and day with the
+# roster size, the ids marked present, their count and the last update, so the
+# summary does not re-read the roster and attendance on every scan. Marks add
+# ids with a set union (replays and concurrent marks cannot double count);
+# roster changes drop "total", which the next read recounts. Reads also merge
+# the stored attendance again every STATS_RECONCILE_SECONDS, which repairs
+# counters whose update failed after the mark was stored. Only today's
+# document is written; other days are counted read-only.
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "60"))
+
+def _attendance_date(date: Optional[str]) -> str:
+    """Today (UTC) when date is None, otherwise date validated as YYYY-MM-DD."""
+    if date is None:
+        return datetime.now(timezone.utc).date().isoformat()
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+
+async def _record_present(section_id: str, date: str, student_ids: List[str]) -> None:
+    await db.section_day_stats.update_one(
+        {"section_id": section_id, "date": date},
+        [
+            {"$set": {
+                "present": {"$setUnion": [{"$ifNull": ["$present", []]}, {"$literal": student_ids}]},
+                "updated_at": now_iso(),
+            }},
+            {"$set": {"present_count": {"$size": "$present"}}},
+        ],
+        upsert=True,
+    )
+
+async def _record_flushed_marks(marks: List[Dict[str, Any]]) -> None:
+    by_day: Dict[Tuple[str, str], List[str]] = {}
+    for m in marks:
+        by_day.setdefault((m["section_id"], m["date"]), []).append(m["student_id"])
+    for (section_id, date), student_ids in by_day.items():
+        await _record_present(section_id, date, student_ids)
+
+async def _reset_day_totals(*section_ids: str) -> None:
+    date = datetime.now(timezone.utc).date().isoformat()
+    await db.section_day_stats.update_many(
+        {"section_id": {"$in": list(section_ids)}, "date": date}, {"$unset": {"total": ""}})
+
+async def _day_stats(section_id: str, date: str) -> Dict[str, Any]:
+    today = date == datetime.now(timezone.utc).date().isoformat()
+    if today:
+        stats = await db.section_day_stats.find_one({"section_id": section_id, "date": date}, {"_id": 0})
+        reconciled_at = stats.get("reconciled_at") if stats else None
+        if reconciled_at is not None and reconciled_at.tzinfo is None:
+            reconciled_at = reconciled_at.replace(tzinfo=timezone.utc)  # Mongo returns naive UTC
+        if (stats is not None and "total" in stats and reconciled_at is not None
+                and now_iso() - reconciled_at < timedelta(seconds=STATS_RECONCILE_SECONDS)):
+            return stats
+    # First read of the day, after a roster change or when due for
+    # reconciliation: count once and merge with the marks recorded meanwhile
+    total = await db.students.count_documents({"section_id": section_id})
+    present = await db.attendance.distinct("student_id", {"section_id": section_id, "date": date, "status": "Present"})
+    if not today:
+        return {"section_id": section_id, "date": date, "total": total, "present": present,
+                "present_count": len(present), "updated_at": None}
+    return await db.section_day_stats.find_one_and_update(
+        {"section_id": section_id, "date": date},
+        [
+            {"$set": {
+                "total": total,
+                "present": {"$setUnion": [{"$ifNull": ["$present", []]}, {"$literal": present}]},
+                "updated_at": now_iso(),
+                "reconciled_at": now_iso(),
+            }},
+            {"$set": {"present_count": {"$size": "$present"}}},
+        ],
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def _mark_present(section_id: str, student_id: str, teacher_id: str) -> bool:
+    """
+    Record today's attendance for a student in one atomic upsert on the unique
+    (section_id, date, student_id) index, or in the write-behind buffer when
+    enabled; False when already marked.
+    """
+    date = datetime.now(timezone.utc).date().isoformat()
+    if ATTENDANCE_BUFFER is not None:
+        return await ATTENDANCE_BUFFER.mark(section_id, student_id, teacher_id, date, now_iso(), str(uuid.uuid4()))
+    try:
+        res = await db.attendance.update_one(
+            {"section_id": section_id, "date": date, "student_id": student_id},
+            {"$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "status": "Present",
+                "teacher_id": teacher_id,
+                "timestamp": now_iso(),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # A concurrent scan of the same student inserted first
+        return False
+    if res.upserted_id is None:
+        return False
+    try:
+        await _record_present(section_id, date, [student_id])
+    except Exception as e:
+        # The mark is stored; the next reconciliation repairs the counter
+        logger.error(f"Day stats update for section {section_id} failed: {e}")
+    return True
+
+@api.post("/attendance/mark", response_model=AttendanceMarkResponse)
+async def mark_attendance(
+    image: UploadFile = File(...),
+    section_id: Optional[str] = Form(None),
+    current: dict = Depends(require_roles('TEACHER')),
+):
+    chosen_section = await _resolve_teacher_section(section_id, current)
 
     data = await image.read()
-    face, err = await _detect_and_crop_face_mesh(data)
-    if face is None:
-        raise HTTPException(status_code=400, detail=f"No face detected: {err}")
-    emb, e2 = await _embed_face_with_mobilefacenet(face)
-    if not emb:
-        raise HTTPException(status_code=400, detail=f"No embedding generated: {e2}")
-
-    # Load students for this section only
-    students = await db.students.find({"section_id": chosen_section}).to_list(2000)
-    best_id = None
-    best_name = None
-    best_sim = -1.0
-    twin_conflict = False
-
-    for s in students:
-        s_embs = s.get("embeddings", [])
-        sims = [_cosine_sim(emb, e) for e in s_embs if isinstance(e, list)]
-        sim = max(sims) if sims else -1.0
-        if sim > best_sim:
-            best_sim = sim
-            best_id = s["id"]
-            best_name = s["name"]
-
-    threshold = 0.90  # 90%
-    if best_sim < threshold:
+    emb, err = await _embed_upload(data)
+    if emb is None:
+        raise HTTPException(status_code=400, detail=err)
+
+    # Match against the cached gallery for this section only
+    gallery = await _get_section_gallery(chosen_section)
+    best_id, best_sim = gallery.match(emb)
+    best_name = gallery.names.get(best_id) if best_id else None
+    if best_sim < MATCH_THRESHOLD:
         return AttendanceMarkResponse(status="Not a student from this section")
 
-    # Check twin
-    stu = await db.students.find_one({"id": best_id})
-    if stu and stu.get("has_twin") and stu.get("twin_group_id"):
-        # Another student in same twin group?
-        twin_count = await db.students.count_documents({"twin_group_id": stu["twin_group_id"], "section_id": chosen_section})
-        if twin_count >= 2:
-            twin_conflict = True
-
-    # Prevent duplicate for today
-    today = datetime.now(timezone.utc).date()
-    start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    end = start + timedelta(days=1)
-    existing = await db.attendance.find_one({"student_id": best_id, "section_id": chosen_section, "timestamp": {"$gte": start, "$lt": end}})
-    if existing:
+    twin_conflict = gallery.twin_conflict(best_id)
+    if not await _mark_present(chosen_section, best_id, current["id"]):
         return AttendanceMarkResponse(status="Already marked present", student_id=best_id, student_name=best_name, similarity=best_sim, twin_conflict=twin_conflict)
-
-    rec = {
-        "id": str(uuid.uuid4()),
-        "date": start.date().isoformat(),
-        "section_id": chosen_section,
-        "student_id": best_id,
-        "status": "Present",
-        "teacher_id": current["id"],
-        "timestamp": now_iso(),
-    }
-    await db.attendance.insert_one(rec)
     return AttendanceMarkResponse(status=f"{best_name} is marked present, scan next student", student_id=best_id, student_name=best_name, similarity=best_sim, twin_conflict=twin_conflict)
 
+class GroupFaceResult(BaseModel):
+    box: List[int]  # x1, y1, x2, y2 in image pixels
+    status: Literal['marked', 'already_marked', 'not_recognized', 'duplicate_face', 'low_quality']
+    reason: Optional[str] = None  # quality reason code for low_quality faces
+    student_id: Optional[str] = None
+    student_name: Optional[str] = None
+    similarity: Optional[float] = None
+    twin_conflict: bool = False
+
+class GroupAttendanceResponse(BaseModel):
+    section_id: str
+    faces_detected: int
+    marked_count: int
+    already_marked_count: int
+    results: List[GroupFaceResult]
+
+@api.post("/attendance/mark-group", response_model=GroupAttendanceResponse)
+async def mark_group_attendance(
+    image: UploadFile = File(...),
+    section_id: Optional[str] = Form(None),
+    current: dict = Depends(require_roles('TEACHER')),
+):
+    """
+    Mark attendance for every recognised face in one classroom photo.
+    """
+    chosen_section = await _resolve_teacher_section(section_id, current)
+
+    data = await image.read()
+    faces, err = await _detect_all_faces(data)
+    if not faces:
+        raise HTTPException(status_code=400, detail=f"No face detected: {err}" if err else "No face detected")
+    # Only faces that pass quality gating are embedded and matched
+    usable = [i for i, f in enumerate(faces) if not _quality_reason(f)]
+    matches: List[Tuple[Optional[str], float]] = [(None, -1.0)] * len(faces)
+    gallery = await _get_section_gallery(chosen_section)
+    if usable:
+        embs, e2 = await _embed_faces_with_mobilefacenet([faces[i].crop for i in usable])
+        if not embs:
+            raise HTTPException(status_code=400, detail=f"No embedding generated: {e2}")
+        for i, match in zip(usable, gallery.match_many(embs)):
+            matches[i] = match
+
+    # Best face per recognised student; any other face matching the same student is a duplicate
+    best_face: Dict[str, int] = {}
+    for i, (sid, sim) in enumerate(matches):
+        if sid is not None and sim >= MATCH_THRESHOLD and (sid not in best_face or sim > matches[best_face[sid]][1]):
+            best_face[sid] = i
+    matched_ids = list(best_face)
+
+    newly_marked = set()
+    if matched_ids and ATTENDANCE_BUFFER is not None:
+        newly_marked = {sid for sid in matched_ids if await _mark_present(chosen_section, sid, current["id"])}
+    elif matched_ids:
+        date = datetime.now(timezone.utc).date().isoformat()
+        ops = [
+            UpdateOne(
+                {"section_id": chosen_section, "date": date, "student_id": sid},
+                {"$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "status": "Present",
+                    "teacher_id": current["id"],
+                    "timestamp": now_iso(),
+                }},
+                upsert=True,
+            )
+            for sid in matched_ids
+        ]
+        try:
+            res = await db.attendance.bulk_write(ops, ordered=False)
+            upserted = res.upserted_ids.keys()
+        except BulkWriteError as e:
+            # Concurrent marks of the same student lose the race on the unique index
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            upserted = [u["index"] for u in e.details.get("upserted", [])]
+        newly_marked = {matched_ids[i] for i in upserted}
+        if newly_marked:
+            try:
+                await _record_present(chosen_section, date, list(newly_marked))
+            except Exception as e:
+                # The marks are stored; the next reconciliation repairs the counter
+                logger.error(f"Day stats update for section {chosen_section} failed: {e}")
+
+    results: List[GroupFaceResult] = []
+    for i, (face, (sid, sim)) in enumerate(zip(faces, matches)):
+        reason = _quality_reason(face)
+        if reason:
+            results.append(GroupFaceResult(box=list(face.box), status='low_quality', reason=reason))
+            continue
+        result = GroupFaceResult(box=list(face.box), status='not_recognized', similarity=sim)
+        if sid in best_face and sim >= MATCH_THRESHOLD:
+            result.student_id = sid
+            result.student_name = gallery.names.get(sid)
+            result.twin_conflict = gallery.twin_conflict(sid)
+            if best_face[sid] != i:
+                result.status = 'duplicate_face'
+            elif sid in newly_marked:
+                result.status = 'marked'
+            else:
+                result.status = 'already_marked'
+        results.append(result)
+
+    return GroupAttendanceResponse(
+        section_id=chosen_section,
+        faces_detected=len(faces),
+        marked_count=len(newly_marked),
+        already_marked_count=len(matched_ids) - len(newly_marked),
+        results=results,
+    )
+
+# ---------- Streaming scan sessions (WebSocket) ----------
+class ScanSession:
+    """
+    State of one continuous scanning session: the teacher and section are
+    validated once, and the section gallery is held for the whole session
+    (reloaded only when the section's students change).
+
+    Faces are followed across frames by a FaceTracker on top of a detector in
+    tracking mode; a track is embedded only until it is identified, after
+    which its student is reported without running MobileFaceNet again.
+    """
+
+    def __init__(self, section_id: str, teacher: dict):
+        self.section_id = section_id
+        self.teacher = teacher
+        self.marked: set = set()
+        self.frames = 0
+        self.dropped = 0
+        self.embedded = 0
+        self.tracker = FaceTracker(STREAM_TRACK_IOU, STREAM_TRACK_MAX_MISSES)
+        self._detector = None
+        self._gallery: Optional[SectionGallery] = None
+        self._generation = -1
+
+    async def start(self) -> None:
+        global TRACKING_SESSIONS
+        if not STREAM_TRACKING or TRACKING_SESSIONS >= STREAM_TRACKING_SESSIONS:
+            return
+        TRACKING_SESSIONS += 1
+        try:
+            self._detector = await asyncio.to_thread(create_detector, FACE_DETECTOR, STREAM_MAX_FACES, True)
+        except Exception as e:
+            TRACKING_SESSIONS -= 1
+            logger.warning(f"Tracking detector unavailable, scan session falls back to the detection pool: {e}")
+
+    def close(self) -> None:
+        global TRACKING_SESSIONS
+        if self._detector is None:
+            return
+        close = getattr(self._detector, "close", None)
+        if close is not None:
+            close()
+        self._detector = None
+        TRACKING_SESSIONS -= 1
+
+    async def gallery(self) -> SectionGallery:
+        generation = GALLERY_CACHE.generation(self.section_id)
+        if self._gallery is None or generation != self._generation:
+            self._gallery = await _get_section_gallery(self.section_id)
+            self._generation = generation
+            # Students changed: identities of live tracks may be stale
+            for track in self.tracker.tracks:
+                track.student_id, track.similarity = None, -1.0
+        return self._gallery
+
+    async def _detect(self, frame: bytes):
+        if self._detector is not None:
+            # Frames of a session are processed one at a time, so the detector is never shared
+            return await asyncio.to_thread(detect_faces, self._detector, frame)
+        return await _detect_all_faces(frame)
+
+    def _event(self, track: Track, event_type: str, gallery: SectionGallery) -> Dict[str, Any]:
+        sid = track.student_id
+        return {
+            "type": event_type,
+            "track_id": track.track_id,
+            "box": list(track.box),
+            "student_id": sid,
+            "student_name": gallery.names.get(sid),
+            "similarity": track.similarity,
+            "twin_conflict": gallery.twin_conflict(sid),
+        }
+
+    async def process(self, frame: bytes) -> List[Dict[str, Any]]:
+        self.frames += 1
+        try:
+            faces, err = await self._detect(frame)
+        except HTTPException as e:
+            return [{"type": "error", "detail": e.detail}]
+        if faces is None:
+            self.tracker.update([])
+            return [{"type": "no_face", "reason": err}]
+
+        gallery = await self.gallery()
+        tracks = self.tracker.update([f.box for f in faces])
+        pending = []
+        events: List[Dict[str, Any]] = []
+        for face, track in zip(faces, tracks):
+            if track.identified:
+                events.append(self._event(track, "tracked", gallery))
+                continue
+            reason = _quality_reason(face)
+            if reason:
+                # Wait for a better frame of this track instead of embedding this one
+                events.append({"type": "low_quality", "track_id": track.track_id, "box": list(track.box), "reason": reason})
+                continue
+            pending.append((face, track))
+        if not pending:
+            return events
+
+        embs, e2 = await _embed_faces_with_mobilefacenet([face.crop for face, _ in pending])
+        if embs is None:
+            return events + [{"type": "error", "detail": f"No embedding generated: {e2}"}]
+        self.embedded += len(pending)
+        for (face, track), (sid, sim) in zip(pending, gallery.match_many(embs)):
+            track.embeddings += 1
+            if sid is None or sim < MATCH_THRESHOLD:
+                events.append({"type": "unknown", "track_id": track.track_id, "box": list(track.box), "similarity": sim})
+                continue
+            track.student_id, track.similarity = sid, sim
+            if sid in self.marked:
+                events.append(self._event(track, "already_marked", gallery))
+                continue
+            newly_marked = await _mark_present(self.section_id, sid, self.teacher["id"])
+            self.marked.add(sid)
+            events.append(self._event(track, "marked" if newly_marked else "already_marked", gallery))
+        return events
+
+@api.websocket("/attendance/stream")
+async def attendance_stream(websocket: WebSocket, token: str = "", section_id: Optional[str] = None):
+    """
+    Continuous attendance scanning. Connect with ?token=<JWT>&section_id=<id>,
+    then send camera frames as binary JPEG messages. Each processed frame is
+    answered with a JSON event (no_face, unknown, marked, already_marked or
+    error). Frames that arrive while one is being processed replace each
+    other, so only the newest waiting frame is scanned.
+    """
+    await websocket.accept()
+    try:
+        teacher = await get_current_user(token)
+        if teacher.get("role") != 'TEACHER':
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        chosen_section = await _resolve_teacher_section(section_id, teacher)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=4000 + e.status_code)
+        return
+
+    session = ScanSession(chosen_section, teacher)
+    try:
+        await session.start()
+        gallery = await session.gallery()
+    except Exception as e:
+        logger.error(f"Scan session for section {chosen_section} could not start: {e}")
+        session.close()
+        await websocket.send_json({"type": "error", "detail": "Scanning is not available right now"})
+        await websocket.close(code=1011)
+        return
+    send_lock = asyncio.Lock()
+
+    async def send(event: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(event)
+
+    await send({"type": "ready", "section_id": chosen_section, "students": len(gallery.names)})
+
+    pending: Dict[str, Optional[bytes]] = {"frame": None}
+    frame_ready = asyncio.Event()
+
+    async def process_frames() -> None:
+        try:
+            while True:
+                await frame_ready.wait()
+                frame_ready.clear()
+                frame, pending["frame"] = pending["frame"], None
+                if frame is None:
+                    continue
+                try:
+                    events = await session.process(frame)
+                except Exception as e:
+                    # e.g. Mongo unavailable while loading the gallery or marking;
+                    # report it and keep scanning later frames
+                    logger.exception(f"Scan session for section {chosen_section} failed on a frame: {e}")
+                    events = [{"type": "error", "detail": "Frame could not be processed"}]
+                for event in events:
+                    await send({**event, "frame": session.frames})
+        except Exception as e:
+            # Sending failed: close so the receive loop ends instead of taking
+            # frames nobody answers
+            logger.error(f"Scan session for section {chosen_section} stopped: {e}")
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+
+    worker = asyncio.create_task(process_frames())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                if pending["frame"] is not None:
+                    session.dropped += 1
+                pending["frame"] = message["bytes"]
+                frame_ready.set()
+            elif message.get("text"):
+                try:
+                    command = json.loads(message["text"]).get("type")
+                except (ValueError, AttributeError):
+                    command = None
+                if command == "ping":
+                    await send({"type": "pong"})
+                elif command == "stop":
+                    await send({"type": "stopped", "frames": session.frames, "dropped": session.dropped,
+                                "embedded": session.embedded, "marked": len(session.marked)})
+                    await websocket.close()
+                    break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+        try:
+            await worker
+        except (asyncio.CancelledError, Exception):
+            pass
+        session.close()
+        logger.info(f"Scan session for section {chosen_section} ended: {session.frames} frames, {session.dropped} dropped, "
+                    f"{session.embedded} faces embedded, {len(session.marked)} marked")
+
+class IdentifyCandidate(BaseModel):
+    student_id: str
+    name: Optional[str] = None
+    section_id: Optional[str] = None
+    similarity: float
+
+class IdentifyResponse(BaseModel):
+    candidates: List[IdentifyCandidate]
+    search_ms: float
+
+@api.post("/attendance/identify", response_model=IdentifyResponse)
+async def identify_student(
+    image: UploadFile = File(...),
+    k: int = Form(5),
+    current: dict = Depends(require_roles('TEACHER', 'SCHOOL_ADMIN', 'CO_ADMIN')),
+):
+    """
+    Identify a face against every student of the caller's school (e.g. at the
+    school gate or when scanned at the wrong section). Does not mark attendance.
+    """
+    school_id = current.get("school_id")
+    if not school_id:
+        raise HTTPException(status_code=400, detail="No school associated")
+    if not 1 <= k <= 20:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 20")
+
+    data = await image.read()
+    emb, err = await _embed_upload(data)
+    if emb is None:
+        raise HTTPException(status_code=400, detail=err)
+
+    index = await _get_school_index(school_id)
+    if index is None:
+        return IdentifyResponse(candidates=[], search_ms=0.0)
+    start = time.perf_counter()
+    hits = index.search(emb, k)
+    search_ms = (time.perf_counter() - start) * 1000
+    return IdentifyResponse(
+        candidates=[IdentifyCandidate(student_id=sid, similarity=sim, **index.students.get(sid, {})) for sid, sim in hits],
+        search_ms=round(search_ms, 3),
+    )
+
 class AttendanceSummaryItem(BaseModel):
     student_id: str
     name: str
@@ -762,10 +2112,12 @@ class AttendanceSummary(BaseModel):
     date: str
     total: int
     present_count: int
-    items: List[AttendanceSummaryItem]
+    present_ids: List[str] = []
+    updated_at: Optional[datetime] = None
+    items: Optional[List[AttendanceSummaryItem]] = None  # omitted when include_items is false
 
 @api.get("/attendance/summary", response_model=AttendanceSummary)
-async def attendance_summary(section_id: str, date: Optional[str] = None, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER'))):
+async def attendance_summary(section_id: str, date: Optional[str] = None, include_items: bool = True, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER'))):
     # Scope check for school admins and teachers
     sec = await db.sections.find_one({"id": section_id})  # noqa: F841
     if not sec:
@@ -773,17 +2125,92 @@ async def attendance_summary(section_id: str, date: Optional[str] = None, curren
     if current['role'] in ('SCHOOL_ADMIN', 'CO_ADMIN', 'TEACHER') and sec.get('school_id') != current.get('school_id'):
         raise HTTPException(status_code=403, detail="Not allowed")
 
-    if date is None:
-        today = datetime.now(timezone.utc).date()
-        date = today.isoformat()
+    date = _attendance_date(date)
+
+    stats = await _day_stats(section_id, date)
+    present_ids = set(stats.get("present", []))
+    if ATTENDANCE_BUFFER is not None:
+        # Include marks accepted but not flushed yet
+        present_ids |= ATTENDANCE_BUFFER.present(section_id, date)
+    summary = AttendanceSummary(section_id=section_id, date=date, total=stats["total"], present_count=len(present_ids),
+                                present_ids=sorted(present_ids), updated_at=stats.get("updated_at"))
+    if include_items:
+        students = await _get_section_roster(section_id)
+        summary.items = [AttendanceSummaryItem(student_id=s['id'], name=s['name'], present=s['id'] in present_ids) for s in students]
+    return summary
+
+class SectionAttendanceCount(BaseModel):
+    section_id: str
+    name: str
+    grade: Optional[str] = None
+    total: int
+    present_count: int
 
-    students = await db.students.find({"section_id": section_id}).to_list(5000)
-    # ids not used in response; keep for potential future use
-    ids = [s['id'] for s in students]  # noqa: F841
-    atts = await db.attendance.find({"section_id": section_id, "date": date}).to_list(10000)
-    present_ids = {a['student_id'] for a in atts if a.get('status') == 'Present'}
-    items = [AttendanceSummaryItem(student_id=s['id'], name=s['name'], present=s['id'] in present_ids) for s in students]
-    return AttendanceSummary(section_id=section_id, date=date, total=len(students), present_count=len(present_ids), items=items)
+class SchoolAttendanceSummary(BaseModel):
+    school_id: str
+    date: str
+    total: int
+    present_count: int
+    sections: List[SectionAttendanceCount]
+
+@api.get("/attendance/school-summary", response_model=SchoolAttendanceSummary)
+async def school_attendance_summary(school_id: Optional[str] = None, date: Optional[str] = None, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN'))):
+    if current['role'] in ('SCHOOL_ADMIN', 'CO_ADMIN'):
+        if school_id and school_id != current.get('school_id'):
+            raise HTTPException(status_code=403, detail="Not allowed")
+        school_id = current.get('school_id')
+    if not school_id:
+        raise HTTPException(status_code=400, detail="school_id is required")
+    date = _attendance_date(date)
+
+    # Marks accepted by the write-behind buffer but possibly not stored yet;
+    # they are unioned with the stored ids, so a flush that completes while
+    # the aggregation runs is counted once
+    unflushed = ATTENDANCE_BUFFER.unflushed(date) if ATTENDANCE_BUFFER is not None else {}
+    unflushed_ids = {"$ifNull": [{"$arrayElemAt": [{"$map": {
+        "input": {"$filter": {
+            "input": {"$literal": [{"section_id": k, "ids": v} for k, v in unflushed.items()]},
+            "cond": {"$eq": ["$$this.section_id", "$id"]},
+        }},
+        "in": "$$this.ids",
+    }}, 0]}, []]}
+
+    # One round trip for every section: roster sizes and present ids are
+    # read inside $lookup pipelines on (section_id, ...) indexes, so no
+    # student or attendance document leaves the database
+    rows = await db.sections.aggregate([
+        {"$match": {"school_id": school_id}},
+        {"$sort": {"name": 1}},
+        {"$lookup": {
+            "from": "students",
+            "let": {"section_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$section_id", "$$section_id"]}}},
+                {"$count": "n"},
+            ],
+            "as": "students",
+        }},
+        {"$lookup": {
+            "from": "attendance",
+            "let": {"section_id": "$id"},
+            "pipeline": [
+                {"$match": {"date": date, "status": "Present", "$expr": {"$eq": ["$section_id", "$$section_id"]}}},
+                {"$project": {"_id": 0, "student_id": 1}},
+            ],
+            "as": "present",
+        }},
+        {"$project": {
+            "_id": 0,
+            "section_id": "$id",
+            "name": 1,
+            "grade": 1,
+            "total": {"$ifNull": [{"$arrayElemAt": ["$students.n", 0]}, 0]},
+            "present_count": {"$size": {"$setUnion": ["$present.student_id", unflushed_ids]}},
+        }},
+    ]).to_list(None)
+    sections = [SectionAttendanceCount(**r) for r in rows]
+    return SchoolAttendanceSummary(school_id=school_id, date=date, total=sum(s.total for s in sections),
+                                   present_count=sum(s.present_count for s in sections), sections=sections)
 
 @api.delete("/sections/{section_id}")
 async def delete_section(section_id: str, current: dict = Depends(require_roles('SCHOOL_ADMIN', 'GOV_ADMIN'))):
@@ -793,12 +2220,16 @@ async def delete_section(section_id: str, current: dict = Depends(require_roles(
     if current['role'] == 'SCHOOL_ADMIN' and sec.get('school_id') != current.get('school_id'):
         raise HTTPException(status_code=403, detail="Not allowed")
     await db.students.delete_many({"section_id": section_id})
+    await db.student_faces.delete_many({"section_id": section_id})
     await db.sections.delete_one({"id": section_id})
+    await db.section_day_stats.delete_many({"section_id": section_id})
+    await _invalidate_section_galleries(section_id, school_id=sec["school_id"])
+    SCHOOL_INDEX.invalidate(sec["school_id"])
     return {"deleted": True}
 
 
-@api.get("/sections", response_model=List[Section])
-async def list_sections(school_id: Optional[str] = None, current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN', 'GOV_ADMIN', 'TEACHER'))):
+@api.get("/sections", response_model=Union[List[Section], Page[Section]])
+async def list_sections(school_id: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None, current: dict = Depends(require_roles('SCHOOL_ADMIN', 'CO_ADMIN', 'GOV_ADMIN', 'TEACHER'))):
     query: Dict[str, Any] = {}
     if school_id:
         query["school_id"] = school_id
@@ -806,8 +2237,7 @@ async def list_sections(school_id: Optional[str] = None, current: dict = Depends
         query["school_id"] = current.get("school_id")
     elif current["role"] == 'TEACHER' and current.get("school_id"):
         query["school_id"] = current.get("school_id")
-    items = await db.sections.find(query).to_list(1000)
-    return [Section(**i) for i in items]
+    return await _paged_list(db.sections, query, lambda i: Section(**i), limit, cursor)
 
 # Students
 @api.post("/students/create", response_model=Student)
@@ -832,6 +2262,9 @@ async def create_student(payload: StudentCreate, current: dict = Depends(require
         "created_at": now_iso(),
     }
     await db.students.insert_one(doc)
+    await _reset_day_totals(payload.section_id)
+    await _invalidate_section_galleries(payload.section_id, school_id=sec.get("school_id"))
+    _index_student_added(sec.get("school_id"), doc)
     return Student(**doc)
 
 @api.put("/students/{student_id}", response_model=Student)
@@ -846,7 +2279,10 @@ async def update_student(student_id: str, payload: StudentUpdate, current: dict
     if not upd:
         raise HTTPException(status_code=400, detail="Nothing to update")
     await db.students.update_one({"id": student_id}, {"$set": upd})
-    stu = await db.students.find_one({"id": student_id})
+    await _invalidate_section_galleries(stu['section_id'], school_id=sec.get('school_id') if sec else None)
+    if 'name' in upd:
+        _index_student_updated(sec.get('school_id') if sec else None, student_id, name=upd['name'])
+    stu = await db.students.find_one({"id": student_id}, STUDENT_PROJECTION)
     return Student(**stu)
 
 @api.delete("/students/{student_id}")
@@ -858,6 +2294,10 @@ async def delete_student(student_id: str, current: dict = Depends(require_roles(
     if current['role'] == 'SCHOOL_ADMIN' and sec and sec.get('school_id') != current.get('school_id'):
         raise HTTPException(status_code=403, detail="Not allowed")
     await db.students.delete_one({"id": student_id})
+    await db.student_faces.delete_many({"student_id": student_id})
+    await _reset_day_totals(stu['section_id'])
+    await _invalidate_section_galleries(stu['section_id'], school_id=sec.get('school_id') if sec else None)
+    _index_student_removed(sec.get('school_id') if sec else None, student_id)
     return {"deleted": True}
 
 # Users (Teachers, Co-Admins)
@@ -949,17 +2389,17 @@ async def create_coadmin(payload: UserCreate, current: dict = Depends(require_ro
 # List users by role (scoped)
 class UsersListResponse(BaseModel):
     users: List[UserPublic]
+    next_cursor: Optional[str] = None  # only with ?limit=
 
 @api.get("/users", response_model=UsersListResponse)
-async def list_users(role: Role, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN'))):
+async def list_users(role: Role, limit: Optional[int] = None, cursor: Optional[str] = None, current: dict = Depends(require_roles('GOV_ADMIN', 'SCHOOL_ADMIN', 'CO_ADMIN'))):
     query: Dict[str, Any] = {"role": role}
     if current["role"] in ('SCHOOL_ADMIN', 'CO_ADMIN'):
         query["school_id"] = current.get("school_id")
-    items = await db.users.find(query).to_list(1000)
-    return {"users": [UserPublic(
+    return await _paged_list(db.users, query, lambda u: UserPublic(
         id=u["id"], full_name=u["full_name"], email=u["email"], role=u["role"], phone=u.get("phone"),
         school_id=u.get("school_id"), subject=u.get("subject"), section_id=u.get("section_id"), created_at=u["created_at"]
-    ) for u in items]}
+    ), limit, cursor, key="users")
 
 class UserUpdate(BaseModel):
     full_name: Optional[str] = None
@@ -1026,6 +2466,7 @@ async def resend_credentials(payload: ResendReq, _: dict = Depends(require_roles
 # ---------- Startup tasks: indexes + seeding ----------
 @app.on_event("startup")
 async def on_startup():
+    global ATTENDANCE_BUFFER
     # Indexes
     await db.users.create_index("email", unique=True)
     await db.schools.create_index("name")
@@ -1033,6 +2474,35 @@ async def on_startup():
     await db.students.create_index("section_id")
     await db.students.create_index("twin_group_id")
     await db.attendance.create_index([("section_id", 1), ("date", 1), ("student_id", 1)], unique=True)
+    await db.section_day_stats.create_index([("section_id", 1), ("date", 1)], unique=True)
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.student_faces.create_index("student_id")
+    await db.student_faces.create_index("section_id")
+    await db.students.create_index("face_embeddings.model_version")
+    # Keyset pagination: filter fields followed by the _id sort key
+    await db.sections.create_index([("school_id", 1), ("_id", 1)])
+    await db.sections.create_index([("school_id", 1), ("name", 1)])  # school summary
+    await db.students.create_index([("section_id", 1), ("_id", 1)])
+    await db.users.create_index([("role", 1), ("school_id", 1), ("_id", 1)])
+
+    await db.cache_versions.create_index("updated_at")
+    # Record current cache versions before anything is cached, then follow changes
+    await CACHE_VERSIONS.poll()
+    CACHE_VERSIONS.start()
+
+    if ATTENDANCE_WRITE_BEHIND:
+        buffer = AttendanceBuffer(db.attendance, ATTENDANCE_JOURNAL_PATH, ATTENDANCE_FLUSH_MS / 1000, ATTENDANCE_FLUSH_MAX,
+                                  on_write=_record_flushed_marks)
+        await buffer.start()  # replays marks journaled by a previous process
+        ATTENDANCE_BUFFER = buffer
+
+    if JOB_WORKER:
+        app.state.job_worker = asyncio.create_task(_job_worker())
+
+    # Warm models/indexes in the background; /api/health/ready reports when done
+    if MODEL_WARMUP or INDEX_WARMUP:
+        app.state.warmup_task = asyncio.create_task(_warm_up())
 
     # Seed initial users/school if provided in env
     try:
@@ -1106,7 +2576,19 @@ async def on_startup():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    job_worker = getattr(app.state, "job_worker", None)
+    if job_worker is not None:
+        job_worker.cancel()
+    for task in list(JOB_RUNNING):
+        task.cancel()
+    await CACHE_VERSIONS.stop()
+    if ATTENDANCE_BUFFER is not None:
+        await ATTENDANCE_BUFFER.stop()
     client.close()
+    if DETECTION_POOL is not None:
+        DETECTION_POOL.shutdown()
+    if BACKGROUND_DETECTION_POOL is not None:
+        BACKGROUND_DETECTION_POOL.shutdown()
 
 # Mount router
 app.include_router(api)
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Frame-to-frame face tracking for streaming scan sessions.
+
+Boxes from consecutive frames are associated by IoU, so a face that stays in
+view keeps its track. Once a track is identified its student is remembered and
+the face does not need to be embedded again while the track lives.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]  # x1, y1, x2, y2
+
+
+def iou(a: Box, b: Box) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: Box
+    hits: int = 1
+    misses: int = 0
+    embeddings: int = 0  # embedding runs spent on this track
+    student_id: Optional[str] = None
+    similarity: float = -1.0
+
+    @property
+    def identified(self) -> bool:
+        return self.student_id is not None
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker. A track that is not seen for more than max_misses
+    frames is dropped; a new box overlapping no live track starts a new one.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def update(self, boxes: Sequence[Box]) -> List[Track]:
+        """Associate this frame's boxes with tracks; returns one track per box, in order."""
+        pairs = sorted(
+            ((iou(track.box, box), t, b) for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True,
+        )
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        used = set()
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in used or assigned[b] is not None:
+                continue
+            track = self.tracks[t]
+            track.box, track.hits, track.misses = tuple(boxes[b]), track.hits + 1, 0
+            assigned[b] = track
+            used.add(t)
+
+        for t, track in enumerate(self.tracks):
+            if t not in used:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(track_id=self._next_id, box=tuple(box))
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[b] = track
+        return assigned
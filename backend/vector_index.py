@@ -0,0 +1,174 @@
+"""
+School-wide approximate nearest-neighbour search over student embeddings.
+
+IVFIndex is an inverted-file index in NumPy: embeddings are L2-normalised and
+bucketed by their nearest k-means centroid, and a query only scores the
+buckets of its nprobe nearest centroids. Students can be added and removed
+without a rebuild.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list stays useful
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Cosine-similarity IVF index. `students` maps student_id to display info
+    (name, section_id) returned with search results.
+    """
+
+    def __init__(self, school_id: str, centroids: np.ndarray, nprobe: int):
+        self.school_id = school_id
+        self.centroids = centroids
+        self.dim = centroids.shape[1]
+        self.nprobe = nprobe
+        self.students: Dict[str, Dict[str, Optional[str]]] = {}
+        self._lists: List[np.ndarray] = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(len(centroids))]
+        self._owners: List[List[str]] = [[] for _ in range(len(centroids))]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, school_id: str, entries, nprobe: int = 8, iterations: int = 10,
+              max_train: int = 20000, seed: int = 0) -> Optional["IVFIndex"]:
+        """
+        entries: iterable of (student_id, info, embeddings (n, dim)).
+        Returns None when there is nothing to index.
+        """
+        entries = [(sid, info, embs) for sid, info, embs in entries if embs.size]
+        if not entries:
+            return None
+        dim = entries[0][2].shape[1]
+        entries = [e for e in entries if e[2].shape[1] == dim]
+        vectors = _normalize(np.concatenate([e[2] for e in entries]))
+
+        nlist = max(1, min(1024, int(np.sqrt(len(vectors)))))
+        rng = np.random.default_rng(seed)
+        train = vectors if len(vectors) <= max_train else vectors[rng.choice(len(vectors), max_train, replace=False)]
+        centroids = _spherical_kmeans(train, nlist, iterations, seed) if nlist > 1 else _normalize(train.mean(axis=0))
+
+        index = cls(school_id, centroids, nprobe)
+        for sid, info, embs in entries:
+            index.add(sid, info, embs)
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(owners) for owners in self._owners)
+
+    def add(self, student_id: str, info: Dict[str, Optional[str]], embeddings: np.ndarray) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not embeddings.size or embeddings.shape[1] != self.dim:
+            return
+        vectors = _normalize(embeddings)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        with self._lock:
+            self.students[student_id] = info
+            for c in np.unique(assign):
+                rows = vectors[assign == c]
+                self._lists[c] = np.concatenate([self._lists[c], rows])
+                self._owners[c].extend([student_id] * len(rows))
+
+    def remove(self, student_id: str) -> None:
+        with self._lock:
+            if self.students.pop(student_id, None) is None:
+                return
+            for c, owners in enumerate(self._owners):
+                if student_id not in owners:
+                    continue
+                keep = [i for i, owner in enumerate(owners) if owner != student_id]
+                self._lists[c] = self._lists[c][keep]
+                self._owners[c] = [owners[i] for i in keep]
+
+    def update_info(self, student_id: str, **info) -> None:
+        with self._lock:
+            if student_id in self.students:
+                self.students[student_id] = {**self.students[student_id], **info}
+
+    def search(self, probe, k: int = 5) -> List[Tuple[str, float]]:
+        """Top-k distinct students as (student_id, cosine similarity), best first."""
+        query = _normalize(probe)[0]
+        if query.shape[0] != self.dim:
+            return []
+        with self._lock:
+            probe_lists = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+            candidates = [self._lists[c] for c in probe_lists if len(self._owners[c])]
+            if not candidates:
+                return []
+            owners = [owner for c in probe_lists for owner in self._owners[c]]
+            sims = np.concatenate(candidates) @ query
+
+        best: Dict[str, float] = {}
+        # Visit rows from most to least similar; the first row per student is its best
+        for i in np.argsort(sims)[::-1]:
+            sid = owners[i]
+            if sid not in best:
+                best[sid] = float(sims[i])
+                if len(best) == k:
+                    break
+        return list(best.items())
+
+
+class SchoolIndexCache:
+    """
+    Per-school IVF indexes. Changes to a school whose index is not built yet
+    bump its generation, so an index built from a read that raced with a
+    write is never stored.
+    """
+
+    def __init__(self):
+        self._items: Dict[str, IVFIndex] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, school_id: str) -> Optional[IVFIndex]:
+        with self._lock:
+            return self._items.get(school_id)
+
+    def generation(self, school_id: str) -> int:
+        with self._lock:
+            return self._generations.get(school_id, 0)
+
+    def put(self, index: IVFIndex, generation: int) -> bool:
+        with self._lock:
+            if self._generations.get(index.school_id, 0) != generation:
+                return False
+            self._items[index.school_id] = index
+            return True
+
+    def touch(self, school_id: str) -> Optional[IVFIndex]:
+        """Record a change; returns the built index to update in place, if any."""
+        with self._lock:
+            self._generations[school_id] = self._generations.get(school_id, 0) + 1
+            return self._items.get(school_id)
+
+    def invalidate(self, school_id: str) -> None:
+        with self._lock:
+            self._generations[school_id] = self._generations.get(school_id, 0) + 1
+            self._items.pop(school_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"schools": len(self._items), "vectors": sum(len(i) for i in self._items.values())}
@@ -6,8 +6,10 @@ import React, { useEffect, useRef, useState } from "react";
  * - onToggleFacing: () => void
  * - onCapture: (blob: Blob, dataUrl: string) => void
  * - captureLabel: string
+ * - onFrame: (blob: Blob) => void  optional; called every frameInterval ms while set (live scanning)
+ * - frameInterval: number
  */
-export default function CameraCapture({ facingMode = "user", onToggleFacing, onCapture, captureLabel = "Capture" }) {
+export default function CameraCapture({ facingMode = "user", onToggleFacing, onCapture, captureLabel = "Capture", onFrame, frameInterval = 500 }) {
   const videoRef = useRef(null);
   const [stream, setStream] = useState(null);
   const [error, setError] = useState("");
@@ -40,16 +42,22 @@ export default function CameraCapture({ facingMode = "user", onToggleFacing, onC
     };
   }, [facingMode]);
 
+  const grabCanvas = () => {
+    const video = videoRef.current;
+    if (!video) return null;
+    const w = video.videoWidth || 640;
+    const h = video.videoHeight || 480;
+    const canvas = document.createElement("canvas");
+    canvas.width = w; canvas.height = h;
+    const ctx = canvas.getContext("2d");
+    ctx.drawImage(video, 0, 0, w, h);
+    return canvas;
+  };
+
   const doCapture = async () => {
     try {
-      const video = videoRef.current;
-      if (!video) return;
-      const w = video.videoWidth || 640;
-      const h = video.videoHeight || 480;
-      const canvas = document.createElement("canvas");
-      canvas.width = w; canvas.height = h;
-      const ctx = canvas.getContext("2d");
-      ctx.drawImage(video, 0, 0, w, h);
+      const canvas = grabCanvas();
+      if (!canvas) return;
       const blob = await new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg", 0.9));
       const dataUrl = canvas.toDataURL("image/jpeg", 0.9);
       onCapture && onCapture(blob, dataUrl);
@@ -58,6 +66,16 @@ export default function CameraCapture({ facingMode = "user", onToggleFacing, onC
     }
   };
 
+  // Continuous capture for live scanning
+  useEffect(() => {
+    if (!ready || !onFrame) return undefined;
+    const timer = setInterval(() => {
+      const canvas = grabCanvas();
+      if (canvas) canvas.toBlob((blob) => blob && onFrame(blob), "image/jpeg", 0.8);
+    }, frameInterval);
+    return () => clearInterval(timer);
+  }, [ready, onFrame, frameInterval]);
+
   return (
     <div className="camera_box">
       <div className="video_wrap" style={{ position: 'relative', overflow: 'hidden' }}>
@@ -1,6 +1,6 @@
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import CameraCapture from "./CameraCapture";
-import { api } from "../lib/api";
+import { api, attendanceStreamUrl } from "../lib/api";
 import { Button } from "./ui/button";
 import { Label } from "./ui/label";
 
@@ -13,6 +13,8 @@ export default function TeacherScan({ me }) {
   const [sampleUrl, setSampleUrl] = useState("https://images.pexels.com/photos/2379004/pexels-photo-2379004.jpeg?auto=compress&cs=tinysrgb&dpr=1&w=256");
   const [scanHistory, setScanHistory] = useState([]);
   const [isScanning, setIsScanning] = useState(false);
+  const [liveScan, setLiveScan] = useState(false);
+  const socketRef = useRef(null);
 
   useEffect(() => {
     api.get("/sections").then((res) => {
@@ -68,6 +70,52 @@ export default function TeacherScan({ me }) {
     }
   };
 
+  const addHistory = (result, success) => {
+    const timestamp = new Date().toLocaleTimeString();
+    setScanHistory(prev => [{ timestamp, result, success }, ...prev.slice(0, 9)]);
+  };
+
+  // Live scanning: one WebSocket per session, frames are sent as binary JPEGs
+  useEffect(() => {
+    if (!liveScan || !section) return undefined;
+    const ws = new WebSocket(attendanceStreamUrl(section.id));
+    ws.binaryType = "arraybuffer";
+    socketRef.current = ws;
+    ws.onopen = () => setStatus("🔴 Live scan connected");
+    ws.onmessage = (msg) => {
+      const ev = JSON.parse(msg.data);
+      if (ev.type === "marked") {
+        setStatus(`✅ ${ev.student_name} is marked present`);
+        addHistory(`${ev.student_name} marked present`, true);
+        loadSummary(section.id);
+      } else if (ev.type === "already_marked") {
+        setStatus(`${ev.student_name}: already marked present`);
+      } else if (ev.type === "unknown") {
+        setStatus("Not a student from this section");
+      } else if (ev.type === "low_quality") {
+        setStatus(`📷 Hold still, face not clear enough (${ev.reason})`);
+      } else if (ev.type === "no_face") {
+        setStatus("🔍 Looking for a face...");
+      } else if (ev.type === "error") {
+        setStatus(`❌ ${ev.detail}`);
+      }
+    };
+    ws.onclose = () => {
+      socketRef.current = null;
+      setLiveScan(false);
+    };
+    return () => {
+      socketRef.current = null;
+      ws.close();
+    };
+  }, [liveScan, section]);
+
+  const onFrame = useCallback((blob) => {
+    const ws = socketRef.current;
+    // Skip frames while the socket is still buffering earlier ones
+    if (ws && ws.readyState === WebSocket.OPEN && ws.bufferedAmount === 0) ws.send(blob);
+  }, []);
+
   const addSampleAndScan = async () => {
     try {
       setStatus("📥 Loading sample image...");
@@ -79,20 +127,29 @@ export default function TeacherScan({ me }) {
     }
   };
 
-  const loadSummary = async (sectionId) => {
+  // The roster table is loaded once per section; after scans only the daily
+  // counters are fetched and merged into it
+  const loadSummary = async (sectionId, withItems = false) => {
     try {
       const today = new Date().toISOString().slice(0,10);
       const res = await api.get("/attendance/summary", { 
-        params: { section_id: sectionId, date: today } 
+        params: { section_id: sectionId, date: today, include_items: withItems } 
+      });
+      setSummary(prev => {
+        if (res.data.items || !prev || prev.section_id !== sectionId) return res.data;
+        const present = new Set(res.data.present_ids);
+        return {
+          ...res.data,
+          items: (prev.items || []).map(it => ({ ...it, present: present.has(it.student_id) })),
+        };
       });
-      setSummary(res.data);
     } catch (e) {
       // ignore for now
     }
   };
 
   useEffect(() => {
-    if (section) loadSummary(section.id);
+    if (section) loadSummary(section.id, true);
   }, [section]);
 
   const attendancePercentage = summary ? Math.round((summary.present_count / summary.total) * 100) : 0;
@@ -149,7 +206,21 @@ export default function TeacherScan({ me }) {
               onToggleFacing={()=>setFacingMode(facingMode === 'user' ? 'environment' : 'user')} 
               onCapture={(blob)=>onCapture(blob)} 
               captureLabel={isScanning ? "🔍 Scanning..." : "📸 Scan Student Face"} 
+              onFrame={liveScan ? onFrame : undefined}
             />
+
+            <div className="mt-4 flex justify-center">
+              <Button
+                type="button"
+                className={liveScan ? "btn_primary" : "btn_secondary"}
+                onClick={() => {
+                  if (!section) { setStatus("⚠️ Please select a section first"); return; }
+                  setLiveScan(!liveScan);
+                }}
+              >
+                {liveScan ? "⏹️ Stop Live Scan" : "🔴 Start Live Scan"}
+              </Button>
+            </div>
             
             <div className="mt-4 p-4 bg-white bg-opacity-70 rounded-lg">
               <div className="flex gap-3 items-center">
@@ -249,7 +320,7 @@ export default function TeacherScan({ me }) {
                 </tr>
               </thead>
               <tbody>
-                {summary.items.map((it) => (
+                {(summary.items || []).map((it) => (
                   <tr key={it.student_id}>
                     <td>
                       <span className="font-semibold text-gray-800">{it.name}</span>
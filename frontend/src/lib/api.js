@@ -12,4 +12,11 @@ api.interceptors.request.use((config) => {
     // ignore
   }
   return config;
-});
\ No newline at end of file
+});
+// WebSocket URL for continuous attendance scanning (binary JPEG frames in, JSON events out)
+export function attendanceStreamUrl(sectionId) {
+  const base = (BACKEND_URL || window.location.origin).replace(/^http/, "ws");
+  const params = new URLSearchParams({ token: localStorage.getItem("token") || "" });
+  if (sectionId) params.set("section_id", sectionId);
+  return `${base}/api/attendance/stream?${params.toString()}`;
+}
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timezone
+
+import attendance_buffer
+from attendance_buffer import AttendanceBuffer
+
+DATE = "2026-10-17"
+
+
+class FakeAttendance:
+    def __init__(self, stored=()):
+        self.stored = set(stored)
+        self.fail = False
+        self.writes = 0
+
+    async def distinct(self, field, query):
+        return [sid for sec, sid in self.stored if sec == query["section_id"]]
+
+    async def bulk_write(self, ops, ordered):
+        if self.fail:
+            raise RuntimeError("mongo down")
+        self.writes += 1
+        for op in ops:
+            self.stored.add((op._filter["section_id"], op._filter["student_id"]))
+
+
+def _mark(buffer, student_id, section_id="sec"):
+    return buffer.mark(section_id, student_id, "t1", DATE, datetime.now(timezone.utc), f"m-{student_id}")
+
+
+def test_concurrent_marks_share_journal_writes(tmp_path, monkeypatch):
+    syncs = []
+    write_lines = attendance_buffer._write_lines
+    monkeypatch.setattr(attendance_buffer, "_write_lines", lambda j, lines: (syncs.append(len(lines)), write_lines(j, lines)))
+
+    async def run():
+        coll = FakeAttendance(stored={("sec", "s0")})
+        buffer = AttendanceBuffer(coll, tmp_path / "att.journal", flush_interval=60)
+        await buffer.start()
+        results = await asyncio.gather(*(_mark(buffer, f"s{i}") for i in range(20)))
+        assert results == [False] + [True] * 19
+        assert await _mark(buffer, "s5") is False
+        assert sum(syncs) == 19 and len(syncs) < 19
+        await buffer.flush()
+        assert {sid for _, sid in coll.stored} == {f"s{i}" for i in range(20)}
+        await buffer.stop()
+
+    asyncio.run(run())
+
+
+def test_failed_flushes_keep_one_sealed_segment_and_replay(tmp_path):
+    async def run():
+        coll = FakeAttendance()
+        buffer = AttendanceBuffer(coll, tmp_path / "att.journal", flush_interval=60)
+        await buffer.start()
+        coll.fail = True
+        for i in range(5):
+            await _mark(buffer, f"s{i}")
+            await buffer.flush()
+        assert buffer.flush_failures == 5
+        assert len(list(tmp_path.glob("att.journal.*"))) == 2
+        assert sorted(buffer.unflushed(DATE)["sec"]) == [f"s{i}" for i in range(5)]
+
+        # A new process replays the journal of the crashed one
+        replayed = FakeAttendance()
+        assert await AttendanceBuffer(replayed, tmp_path / "att.journal").replay() == 5
+        assert len(replayed.stored) == 5
+
+        coll.fail = False
+        await buffer.flush()
+        assert len(coll.stored) == 5 and buffer.unflushed(DATE) == {}
+
+    asyncio.run(run())
+
+
+def test_marks_being_flushed_count_as_unflushed(tmp_path):
+    async def run():
+        coll = FakeAttendance()
+        release = asyncio.Event()
+        bulk_write = coll.bulk_write
+
+        async def slow_bulk_write(ops, ordered):
+            await release.wait()
+            await bulk_write(ops, ordered)
+
+        coll.bulk_write = slow_bulk_write
+        buffer = AttendanceBuffer(coll, tmp_path / "att.journal", flush_interval=60)
+        await buffer.start()
+        await _mark(buffer, "s1")
+        flush = asyncio.ensure_future(buffer.flush())
+        await asyncio.sleep(0.01)
+        assert buffer.unflushed(DATE) == {"sec": ["s1"]}
+        release.set()
+        await flush
+        assert buffer.unflushed(DATE) == {}
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from gallery import SectionGallery
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def current_user(token):
+        return {"id": "t1", "role": "TEACHER", "school_id": "school", "section_id": "sec"}
+
+    async def resolve_section(section_id, teacher):
+        return "sec"
+
+    async def start(self):
+        pass
+
+    async def gallery(self):
+        return SectionGallery.from_students("sec", [{"id": "s1", "name": "Student 1"}])
+
+    monkeypatch.setattr(server, "get_current_user", current_user)
+    monkeypatch.setattr(server, "_resolve_teacher_section", resolve_section)
+    monkeypatch.setattr(server.ScanSession, "start", start)
+    monkeypatch.setattr(server.ScanSession, "gallery", gallery)
+    return TestClient(server.app)
+
+
+def test_frame_failure_is_reported_and_scanning_continues(client, monkeypatch):
+    calls = []
+
+    async def process(self, frame):
+        self.frames += 1
+        calls.append(frame)
+        if len(calls) == 1:
+            raise RuntimeError("mongo down")
+        return [{"type": "no_face"}]
+
+    monkeypatch.setattr(server.ScanSession, "process", process)
+    with client.websocket_connect("/api/attendance/stream?token=x") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_bytes(b"frame1")
+        event = ws.receive_json()
+        assert event["type"] == "error"
+        ws.send_bytes(b"frame2")
+        assert ws.receive_json()["type"] == "no_face"
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json()["type"] == "stopped"
+
+
+def test_session_start_failure_closes_socket(client, monkeypatch):
+    async def gallery(self):
+        raise RuntimeError("mongo down")
+
+    monkeypatch.setattr(server.ScanSession, "gallery", gallery)
+    with client.websocket_connect("/api/attendance/stream?token=x") as ws:
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive()["type"] == "websocket.close"
+
+
+def test_tracking_detectors_are_limited_per_process(monkeypatch):
+    import asyncio
+
+    class Detector:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(server, "STREAM_TRACKING", True)
+    monkeypatch.setattr(server, "STREAM_TRACKING_SESSIONS", 1)
+    monkeypatch.setattr(server, "TRACKING_SESSIONS", 0)
+    monkeypatch.setattr(server, "create_detector", lambda kind, max_faces, tracking: Detector())
+
+    async def run():
+        first = server.ScanSession("sec", {})
+        second = server.ScanSession("sec", {})
+        await first.start()
+        await second.start()
+        assert first._detector is not None
+        assert second._detector is None  # detects through the pool instead
+        detector = first._detector
+        first.close()
+        second.close()
+        assert detector.closed and server.TRACKING_SESSIONS == 0
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+TODAY = datetime.now(timezone.utc).date().isoformat()
+
+
+class Coll:
+    def __init__(self, **methods):
+        self.calls = []
+        for name, fn in methods.items():
+            setattr(self, name, self._recorded(name, fn))
+
+    def _recorded(self, name, fn):
+        async def call(*args, **kwargs):
+            self.calls.append(name)
+            return fn(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def summary(monkeypatch):
+    def make(stats_doc=None):
+        stats = Coll(
+            find_one=lambda *a, **k: stats_doc,
+            find_one_and_update=lambda query, pipeline, **k: {
+                "section_id": "sec", "date": query["date"], "total": 3, "present": ["s1", "s2"], "present_count": 2,
+                "updated_at": datetime.now(timezone.utc)},
+        )
+        db = SimpleNamespace(
+            sections=Coll(find_one=lambda *a, **k: {"id": "sec", "school_id": "school"}),
+            section_day_stats=stats,
+            students=Coll(count_documents=lambda *a, **k: 3),
+            attendance=Coll(distinct=lambda *a, **k: ["s1", "s2"]),
+        )
+        monkeypatch.setattr(server, "db", db)
+        return TestClient(server.app), stats
+
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "t1", "role": "TEACHER", "school_id": "school"}
+    yield make
+    server.app.dependency_overrides.clear()
+
+
+def _get(http, date=None):
+    params = {"section_id": "sec", "include_items": "false", **({"date": date} if date else {})}
+    return http.get("/api/attendance/summary", params=params)
+
+
+def test_rejects_malformed_dates(summary):
+    http, _ = summary()
+    assert _get(http, "2026-13-40").status_code == 400
+    assert _get(http, "yesterday").status_code == 400
+
+
+def test_other_days_are_counted_without_writing(summary):
+    http, stats = summary()
+    res = _get(http, "2020-01-01")
+    assert res.status_code == 200
+    assert res.json()["present_count"] == 2 and res.json()["total"] == 3
+    assert stats.calls == []
+
+
+def test_fresh_stats_are_read_as_is(summary):
+    doc = {"section_id": "sec", "date": TODAY, "total": 3, "present": ["s1"], "present_count": 1,
+           "reconciled_at": datetime.now(timezone.utc)}
+    http, stats = summary(doc)
+    assert _get(http).json()["present_ids"] == ["s1"]
+    assert stats.calls == ["find_one"]
+
+
+def test_stale_stats_are_reconciled_with_attendance(summary):
+    doc = {"section_id": "sec", "date": TODAY, "total": 3, "present": ["s1"], "present_count": 1,
+           "reconciled_at": datetime.now(timezone.utc) - timedelta(hours=1)}
+    http, stats = summary(doc)
+    assert _get(http).json()["present_ids"] == ["s1", "s2"]
+    assert stats.calls == ["find_one", "find_one_and_update"]
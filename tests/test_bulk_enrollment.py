@@ -0,0 +1,89 @@
+import zipfile
+
+import pytest
+
+from bulk_enrollment import BulkEnrollmentError, EnrollmentArchive, read_roster
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def test_read_roster_defaults_folder_and_flags():
+    rows = read_roster(b"\xef\xbb\xbfName,Roll_No,has_twin\nAsha,12,yes\nRavi,,\n")
+    assert rows[0] == {"row": 2, "folder": "12", "name": "Asha", "roll_no": "12", "parent_mobile": None,
+                       "has_twin": True, "twin_group_id": None}
+    assert rows[1]["folder"] == "Ravi" and rows[1]["has_twin"] is False
+
+
+def test_read_roster_needs_a_name_column():
+    with pytest.raises(BulkEnrollmentError):
+        read_roster(b"roll_no\n1\n")
+    with pytest.raises(BulkEnrollmentError):
+        read_roster("name\nZoë\n".encode("latin-1"))
+
+
+def test_archive_indexes_folders_and_skips_oversized_images(tmp_path):
+    path = write_zip(tmp_path / "a.zip", {
+        "roster.csv": b"name\nAsha\n",
+        "Asha/1.jpg": b"x" * 10,
+        "Asha/2.jpg": b"x" * 100,
+        "Asha/notes.txt": b"ignored",
+        "__MACOSX/Asha/._1.jpg": b"x",
+    })
+    archive = EnrollmentArchive(path, max_image_bytes=50)
+    try:
+        assert archive.folders == {"Asha": ["Asha/1.jpg"]}
+        assert archive.oversized == {"Asha": 1}
+        assert list(archive.images("Asha", 10)) == [b"x" * 10]
+        assert archive.roster() == b"name\nAsha\n"
+    finally:
+        archive.close()
+
+
+def test_archive_rejects_oversized_roster(tmp_path):
+    path = write_zip(tmp_path / "a.zip", {"roster.csv": b"name\n" + b"a\n" * 100})
+    archive = EnrollmentArchive(path, max_roster_bytes=50)
+    try:
+        with pytest.raises(BulkEnrollmentError):
+            archive.roster()
+    finally:
+        archive.close()
+
+
+def test_archive_rejects_non_zip(tmp_path):
+    path = tmp_path / "a.zip"
+    path.write_bytes(b"not a zip")
+    with pytest.raises(BulkEnrollmentError):
+        EnrollmentArchive(str(path))
+
+
+def test_queue_full_cancels_the_other_detections(monkeypatch):
+    import asyncio
+
+    from fastapi import HTTPException
+
+    import server
+
+    cancelled = []
+
+    async def detect_face(data, background):
+        if data == b"full":
+            raise HTTPException(status_code=503, detail="Face detection is busy, please retry")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(data)
+            raise
+
+    monkeypatch.setattr(server, "_detect_face", detect_face)
+
+    async def run():
+        with pytest.raises(HTTPException):
+            await server._enrollment_embeddings([b"a", b"full", b"b"], background=True)
+
+    asyncio.run(run())
+    assert sorted(cancelled) == [b"a", b"b"]
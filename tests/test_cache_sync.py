@@ -0,0 +1,54 @@
+import asyncio
+
+from cache_sync import CacheVersions
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeVersions:
+    """Just enough of a motor collection for CacheVersions, shared by 'instances'."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, upsert, return_document):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "v": 0})
+        doc["v"] += update["$inc"]["v"]
+        doc.update(update["$set"])
+        return dict(doc)
+
+    def find(self, query):
+        since = query.get("updated_at", {}).get("$gte")
+        return FakeCursor([dict(d) for d in self.docs.values() if since is None or d["updated_at"] >= since])
+
+
+def test_changes_reach_other_instances_only():
+    async def run():
+        coll = FakeVersions()
+        seen_a, seen_b = [], []
+        a = CacheVersions(coll, seen_a.append)
+        b = CacheVersions(coll, seen_b.append)
+        await a.publish(["old"], "school1")
+        await a.poll()
+        await b.poll()  # startup poll only records existing counters
+        assert seen_a == [] and seen_b == []
+
+        await a.publish(["sec1"], "school1")
+        assert await a.poll() == 0
+        assert await b.poll() == 2
+        assert {(d["section_id"], d["school_id"]) for d in seen_b} == {("sec1", "school1"), (None, "school1")}
+        assert await b.poll() == 0
+
+    asyncio.run(run())
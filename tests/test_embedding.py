@@ -0,0 +1,58 @@
+import numpy as np
+
+from embedding import INPUT_SIZE, ShapedInterpreters
+
+
+class FakeInterpreter:
+    """Embeds a face as its mean pixel value; counts tensor allocations."""
+
+    allocations = 0
+
+    def __init__(self, resizable=True):
+        self.resizable = resizable
+        self.shape = [1, INPUT_SIZE, INPUT_SIZE, 3]
+
+    def get_input_details(self):
+        return [{"index": 0, "shape": np.array(self.shape)}]
+
+    def get_output_details(self):
+        return [{"index": 1}]
+
+    def resize_tensor_input(self, index, shape):
+        if not self.resizable:
+            raise ValueError("fixed batch")
+        self.shape = list(shape)
+
+    def allocate_tensors(self):
+        FakeInterpreter.allocations += 1
+
+    def set_tensor(self, index, batch):
+        assert list(batch.shape) == self.shape
+        self.batch = batch
+
+    def invoke(self):
+        self.output = self.batch.reshape(len(self.batch), -1).mean(axis=1, keepdims=True)
+
+    def get_tensor(self, index):
+        return self.output
+
+
+def faces(n):
+    return np.stack([np.full((INPUT_SIZE, INPUT_SIZE, 3), i + 1, dtype=np.float32) for i in range(n)])
+
+
+def test_alternating_batch_sizes_allocate_once_per_size():
+    FakeInterpreter.allocations = 0
+    slot = ShapedInterpreters(FakeInterpreter)
+    for n in (1, 5, 1, 5, 7, 1):
+        out = slot.run(faces(n))
+        assert out[:, 0].tolist() == list(range(1, n + 1))
+    # Sizes 1 and 8 (5 and 7 are padded to 8)
+    assert FakeInterpreter.allocations == 2
+
+
+def test_fixed_batch_model_runs_faces_one_by_one():
+    slot = ShapedInterpreters(lambda: FakeInterpreter(resizable=False))
+    assert slot.run(faces(3))[:, 0].tolist() == [1, 2, 3]
+    assert slot.fixed_batch
+    assert slot.run(faces(2))[:, 0].tolist() == [1, 2]
@@ -0,0 +1,12 @@
+import cv2
+import numpy as np
+
+from face_workers import jpeg_size
+
+
+def test_jpeg_size_reads_the_frame_header():
+    ok, data = cv2.imencode(".jpg", np.zeros((30, 40, 3), np.uint8))
+    assert ok
+    assert jpeg_size(data.tobytes()) == (40, 30)
+    assert jpeg_size(b"\x89PNG\r\n") is None
+    assert jpeg_size(data.tobytes()[:20]) is None
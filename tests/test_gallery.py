@@ -0,0 +1,84 @@
+import numpy as np
+
+from gallery import SectionGallery
+
+
+def _students(n, rng, dim=128):
+    return [{"id": f"s{i}", "name": f"Student {i}",
+             "embeddings": rng.standard_normal((int(rng.integers(2, 7)), dim)).tolist()} for i in range(n)]
+
+
+def _probes(students, rng, n=30):
+    base = np.array([s["embeddings"][0] for s in students[:n]], dtype=np.float32)
+    return base + 0.3 * rng.standard_normal(base.shape).astype(np.float32)
+
+
+def test_shortlist_matches_full_product():
+    rng = np.random.default_rng(1)
+    students = _students(400, rng)
+    shortlisted = SectionGallery.from_students("sec", students, shortlist=8, exit_below=0.0)
+    full = SectionGallery.from_students("sec", students)
+    assert shortlisted._use_shortlist()
+    probes = _probes(students, rng)
+    many = shortlisted.match_many(probes)
+    assert [sid for sid, _ in many] == [f"s{i}" for i in range(len(probes))]
+    assert [sid for sid, _ in many] == [sid for sid, _ in full.match_many(probes)]
+    for probe, (sid, sim) in zip(probes, many):
+        one_sid, one_sim = shortlisted.match(probe)
+        assert one_sid == sid and abs(one_sim - sim) < 1e-5
+
+
+def test_small_sections_use_one_product():
+    rng = np.random.default_rng(2)
+    gallery = SectionGallery.from_students("sec", _students(20, rng), shortlist=8)
+    assert not gallery._use_shortlist()
+
+
+def test_early_exit_keeps_best_centroid():
+    rng = np.random.default_rng(3)
+    gallery = SectionGallery.from_students("sec", _students(400, rng), shortlist=8, exit_below=0.99)
+    sid, sim = gallery.match_many(rng.standard_normal((1, 128)))[0]
+    assert sid is not None and sim < 0.99
+
+
+def test_far_probes_skip_the_embedding_stage():
+    rng = np.random.default_rng(5)
+    # Embeddings of one student are close to each other, like real enrollments
+    faces = rng.standard_normal((60, 1, 128))
+    students = [{"id": f"s{i}", "name": f"Student {i}",
+                 "embeddings": (faces[i] + 0.2 * rng.standard_normal((5, 128))).tolist()} for i in range(60)]
+    gallery = SectionGallery.from_students("sec", students, shortlist=8, exit_below=0.75)
+    assert gallery._use_shortlist()  # a typical section of 300 rows
+    near = _probes(students, rng, n=3)
+    far = rng.standard_normal((4, 128))
+    matches = gallery.match_many(np.concatenate([far[:2], near, far[2:]]))
+    assert gallery.embedding_stage_probes == 3
+    assert [sid for sid, _ in matches[2:5]] == ["s0", "s1", "s2"]
+    assert all(sim < 0.75 for _, sim in matches[:2] + matches[5:])
+    gallery.match(far[0])
+    assert gallery.embedding_stage_probes == 3
+
+
+def test_shortlist_min_rows_is_configurable():
+    rng = np.random.default_rng(6)
+    gallery = SectionGallery.from_students("sec", _students(20, rng), shortlist=8, shortlist_min_rows=0)
+    assert gallery._use_shortlist()
+
+
+def test_empty_and_invalid_probes():
+    rng = np.random.default_rng(4)
+    gallery = SectionGallery.from_students("sec", _students(5, rng))
+    assert gallery.match_many(np.zeros((2, 128))) == [(None, -1.0), (None, -1.0)]
+    assert gallery.match(np.ones(64)) == (None, -1.0)
+    assert SectionGallery.from_students("sec", []).match(np.ones(128)) == (None, -1.0)
+
+
+def test_twin_conflict_needs_both_twins_in_section():
+    students = [
+        {"id": "a", "name": "A", "has_twin": True, "twin_group_id": "g1"},
+        {"id": "b", "name": "B", "has_twin": True, "twin_group_id": "g1"},
+        {"id": "c", "name": "C", "has_twin": True, "twin_group_id": "g2"},
+    ]
+    gallery = SectionGallery.from_students("sec", students)
+    assert gallery.twin_conflict("a") and gallery.twin_conflict("b")
+    assert not gallery.twin_conflict("c")
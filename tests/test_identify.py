@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from vector_index import IVFIndex
+
+
+def _school(n_students=40, per_student=3, dim=128, seed=0):
+    rng = np.random.default_rng(seed)
+    entries = []
+    for i in range(n_students):
+        base = rng.standard_normal(dim).astype(np.float32)
+        embs = base + 0.05 * rng.standard_normal((per_student, dim)).astype(np.float32)
+        entries.append((f"s{i}", {"name": f"Student {i}", "section_id": f"sec{i % 4}"}, embs))
+    return entries
+
+
+def test_ivf_index_finds_the_enrolled_student():
+    entries = _school()
+    index = IVFIndex.build("school", entries, nprobe=4)
+    assert len(index) == sum(len(e[2]) for e in entries)
+    for sid, _, embs in entries[:10]:
+        hits = index.search(embs[0], k=3)
+        assert hits[0][0] == sid
+        assert len({h[0] for h in hits}) == len(hits)
+
+
+def test_ivf_index_build_empty_returns_none():
+    assert IVFIndex.build("school", [("s1", {}, np.zeros((0, 128), dtype=np.float32))]) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    entries = _school()
+    index = IVFIndex.build("school", entries, nprobe=4)
+
+    async def embed_upload(data):
+        return entries[7][2][1].tolist(), None
+
+    async def school_index(school_id):
+        return index if school_id == "school" else None
+
+    monkeypatch.setattr(server, "_embed_upload", embed_upload)
+    monkeypatch.setattr(server, "_get_school_index", school_index)
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "t1", "role": "TEACHER", "school_id": "school"}
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def test_identify_returns_ranked_candidates(client):
+    res = client.post("/api/attendance/identify", files={"image": ("face.jpg", b"jpeg", "image/jpeg")}, data={"k": "3"})
+    assert res.status_code == 200
+    body = res.json()
+    assert body["candidates"][0]["student_id"] == "s7"
+    assert body["candidates"][0]["name"] == "Student 7"
+    assert len(body["candidates"]) == 3
+    assert body["search_ms"] >= 0
+
+
+def test_identify_rejects_bad_k(client):
+    res = client.post("/api/attendance/identify", files={"image": ("face.jpg", b"jpeg", "image/jpeg")}, data={"k": "50"})
+    assert res.status_code == 400
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+class FakeJobs:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, query, update):
+        self.updates.append(update["$set"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.jobs = FakeJobs()
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "JOB_MAX_ATTEMPTS", 3)
+    return db.jobs
+
+
+def run(monkeypatch, error, attempts):
+    async def handler(job):
+        raise error
+
+    monkeypatch.setitem(server.JOB_HANDLERS, "test", handler)
+    asyncio.run(server._run_job({"id": "j1", "type": "test", "attempts": attempts}))
+
+
+def test_busy_detection_requeues_the_job(jobs, monkeypatch):
+    run(monkeypatch, HTTPException(status_code=503, detail="Face detection is busy, please retry"), attempts=1)
+    (update,) = jobs.updates
+    assert update["status"] == "queued" and update["retryable"] and update["status_code"] == 503
+    assert update["detail"] == "Face detection is busy, please retry"
+    assert update["lease_until"] > server.now_iso()
+
+
+def test_busy_detection_on_the_last_attempt_fails_as_retryable(jobs, monkeypatch):
+    run(monkeypatch, HTTPException(status_code=503, detail="Face detection is busy, please retry"), attempts=3)
+    (update,) = jobs.updates
+    assert update["status"] == "failed" and update["retryable"] and update["status_code"] == 503
+
+
+def test_client_errors_fail_with_their_detail(jobs, monkeypatch):
+    run(monkeypatch, HTTPException(status_code=400, detail="No face detected"), attempts=1)
+    (update,) = jobs.updates
+    assert update["status"] == "failed" and not update["retryable"]
+    assert update["detail"] == "No face detected" and update["status_code"] == 400
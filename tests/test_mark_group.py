@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def resolve_section(section_id, teacher):
+        return "sec"
+
+    monkeypatch.setattr(server, "_resolve_teacher_section", resolve_section)
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "t1", "role": "TEACHER", "section_id": "sec"}
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def test_photo_without_faces_has_a_plain_error(client, monkeypatch):
+    async def detect_all_faces(data):
+        return [], None
+
+    monkeypatch.setattr(server, "_detect_all_faces", detect_all_faces)
+    response = client.post("/api/attendance/mark-group", files={"image": ("class.jpg", b"jpeg", "image/jpeg")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No face detected"
+
+
+def test_detector_error_code_is_reported(client, monkeypatch):
+    async def detect_all_faces(data):
+        return None, "decode_failed"
+
+    monkeypatch.setattr(server, "_detect_all_faces", detect_all_faces)
+    response = client.post("/api/attendance/mark-group", files={"image": ("class.jpg", b"jpeg", "image/jpeg")})
+    assert response.json()["detail"] == "No face detected: decode_failed"
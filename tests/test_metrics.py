@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client():
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def as_role(role):
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "u1", "role": role}
+
+
+def test_metrics_need_a_login(client):
+    assert client.get("/api/metrics").status_code == 401
+
+
+def test_metrics_are_for_gov_admins(client):
+    as_role("SCHOOL_ADMIN")
+    assert client.get("/api/metrics").status_code == 403
+    as_role("GOV_ADMIN")
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert "gallery_cache" in response.json()
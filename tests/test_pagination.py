@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+from fastapi.testclient import TestClient
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self._limit = None
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def __aiter__(self):
+        # Like a motor cursor, iterating again continues where it stopped
+        if not hasattr(self, "_it"):
+            self._it = iter(self.docs[:self._limit] if self._limit else self.docs)
+        return self
+
+    async def next(self):
+        return await self.__aiter__().__anext__()
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    name = "schools"
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        after = query["$and"][1]["_id"]["$gt"] if "$and" in query else None
+        return FakeCursor([d for d in self.docs if after is None or d["_id"] > after])
+
+
+def _schools(n):
+    now = datetime.now(timezone.utc)
+    return [{"_id": ObjectId(), "id": f"school{i}", "name": f"School {i}", "created_at": now} for i in range(n)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def with_schools(docs):
+        monkeypatch.setattr(server, "db", SimpleNamespace(schools=FakeCollection(docs)))
+        return TestClient(server.app)
+
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "g1", "role": "GOV_ADMIN"}
+    yield with_schools
+    server.app.dependency_overrides.clear()
+
+
+def test_pages_follow_next_cursor(client):
+    http = client(_schools(5))
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = http.get("/api/schools", params=params).json()
+        ids.append([s["id"] for s in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == [["school0", "school1"], ["school2", "school3"], ["school4"]]
+
+
+def test_without_limit_returns_the_whole_list(client):
+    res = client(_schools(3)).get("/api/schools")
+    assert [s["id"] for s in res.json()] == ["school0", "school1", "school2"]
+    assert client([]).get("/api/schools").json() == []
+
+
+def test_invalid_documents_are_skipped(client):
+    docs = _schools(3)
+    del docs[1]["name"]
+    assert [s["id"] for s in client(docs).get("/api/schools").json()] == ["school0", "school2"]
+
+
+def test_bad_cursor_and_limit(client):
+    http = client(_schools(1))
+    assert http.get("/api/schools", params={"cursor": "not a cursor"}).status_code == 400
+    assert http.get("/api/schools", params={"limit": 0}).status_code == 400
+
+
+def test_openapi_documents_the_page_shape():
+    schema = server.app.openapi()["paths"]["/api/schools"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert len(schema["anyOf"]) == 2
@@ -0,0 +1,26 @@
+from tracker import FaceTracker, iou
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+    assert abs(iou((0, 0, 10, 10), (5, 0, 15, 10)) - 1 / 3) < 1e-9
+
+
+def test_tracker_keeps_tracks_across_frames():
+    tracker = FaceTracker(iou_threshold=0.3, max_misses=1)
+    a, b = tracker.update([(0, 0, 10, 10), (50, 50, 60, 60)])
+    a.student_id = "s1"
+    # Boxes come back in a different order and slightly moved
+    second = tracker.update([(51, 50, 61, 60), (1, 0, 11, 10)])
+    assert [t.track_id for t in second] == [b.track_id, a.track_id]
+    assert second[1].identified and second[1].hits == 2
+
+
+def test_tracker_drops_lost_tracks():
+    tracker = FaceTracker(iou_threshold=0.3, max_misses=1)
+    (first,) = tracker.update([(0, 0, 10, 10)])
+    tracker.update([])
+    tracker.update([])
+    (again,) = tracker.update([(0, 0, 10, 10)])
+    assert again.track_id != first.track_id